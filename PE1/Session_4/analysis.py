@@ -6,6 +6,7 @@ from scipy.optimize import curve_fit
 import tkinter as tk
 from tkinter import filedialog
 import os
+from mydaq import SweepLoader
 
 def find_nearest_idx(a, value):
     return (np.abs(a - value)).argmin()
@@ -139,22 +140,13 @@ def main():
                                             title='Select data file',
                                             )
     
-    # Load the data
-    frequencies = np.load(file_path.replace('.npy', '_frequencies.npy'))
+    # Load the data, memory mapped
+    # remove last 100 ms of data because of readwrite desync
+    sweep = SweepLoader(file_path, trim=slice(None, -samplerate//10))
+    frequencies = sweep.frequencies
     
-    # Load first measurement
-    
-    # Load the rest of the measurements
-    for i in range(repeat):
-        if i == 0:
-            data = np.load(file_path)
-            data_in = [data[0,:,:-samplerate//10]]
-            data_out = [data[1,:,:-samplerate//10]]
-        else:
-            data = np.load(file_path.replace('.npy', f'_{i}.npy'))
-            
-            data_in.append(data[0,:,:-samplerate//10]) # remove last 100 ms of data because of readwrite desync
-            data_out.append(data[1,:,:-samplerate//10]) # remove last 100 ms of data because of readwrite desync
+    data_in = [sweep.repeat_view(i)[0] for i in range(repeat)]
+    data_out = [sweep.repeat_view(i)[1] for i in range(repeat)]
     
     # Get the transfer function and calculate phase, magniotude and gain
     # for each measurement calculate the mean and std.
@@ -144,7 +144,7 @@ if __name__ == "__main__":
                                            initialdir=dir,
                                            title='Select data file',
                                            )
-    data = np.load(file_path)
+    data = np.load(file_path, mmap_mode='r')
     data = data[:,:-samplerate//10] # remove last 100 ms of data because of readwrite desync
     frequencies = np.load(file_path.replace('.npy', '_frequencies.npy'))
 
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
-from mydaq import MyDAQ as MyDaq
+from mydaq import MyDAQ as MyDaq, SweepLoader
 import tkinter as tk
 from tkinter import filedialog
 import os
@@ -40,18 +40,14 @@ file_path = filedialog.askopenfilename(filetypes=[('Numpy files', '.npy')],
                                         title='Select data file',
                                         )
 
-data = np.load(file_path)
-frequencies = np.load(file_path.replace('.npy', '_frequencies.npy'))
-
-data = data[:, :, :, :samplerate//10]
+sweep = SweepLoader(file_path, trim=slice(None, samplerate//10))
+frequencies = sweep.frequencies
 
 # Analyse data
-full_transfer = MyDaq.get_transfer_functions(data,
-                                           frequencies,
-                                           repeat=repeat,
-                                           samplerate=samplerate,
-                                           integration_range=1,
-                                           )
+full_transfer = sweep.transfer_functions(samplerate=samplerate,
+                                         integration_range=1,
+                                         repeat=repeat,
+                                         )
 
 mean_gain, std_gain, mean_phase, std_phase = MyDaq.analyse_transfer(full_transfer)
 
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
-from mydaq import MyDAQ
+from mydaq import MyDAQ, SweepLoader
 import tkinter as tk
 from tkinter import filedialog
 import os
@@ -37,17 +37,15 @@ file_path = filedialog.askopenfilename(filetypes=[('Numpy files', '.npy')],
                                         title='Select data file',
                                         )
 
-data = np.load(file_path)
-frequencies = np.load(file_path.replace('.npy', '_frequencies.npy'))
+sweep = SweepLoader(file_path)
+frequencies = sweep.frequencies
 omegas = 2 * np.pi * frequencies
 
 # Analyse data
-full_transfer = MyDAQ.get_transfer_functions(data,
-                                           frequencies,
-                                           repeat=repeat,
-                                           samplerate=samplerate,
-                                           integration_range=1
-                                           )
+full_transfer = sweep.transfer_functions(samplerate=samplerate,
+                                         integration_range=1,
+                                         repeat=repeat,
+                                         )
 
 mean_gain, std_gain, mean_phase, std_phase = MyDAQ.analyse_transfer(full_transfer)
 
@@ -1,20 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.signal import argrelmax
-from mydaq import MyDAQ
+from mydaq import MyDAQ, PeakDetector
 import tkinter as tk
 from tkinter import filedialog
 import os
 
-
-def exponential_decay(t, C, tau, offset):
-    return C * np.exp(-t / tau) + offset
-
 # Important varialbles
 frequency = 0.8
 duration = 60
-order = 100
+hysteresis = 0.1 # V, above the noise
+decimation = 200 # keep 1 kS/s, a 0.8 Hz decay needs no more
 
 
 # Prompt save file
@@ -39,34 +34,30 @@ signal = daq.generateWaveform('sine', daq.samplerate, frequency, 10,
                               duration=10)[1]
 
 daq.write(signal)
-data = daq.read(duration=duration)
+data = daq.read(duration=duration, decimate=decimation)
 
 # Save data
 np.save(savefile, data)
 
 # Analyse data
-time = daq.getTimeArray(duration, daq.samplerate)
+time = daq.getTimeArray(duration, daq.samplerate)[::decimation]
 
 fig, ax = plt.subplots(dpi=300, figsize=(16, 9))
 
 ax.scatter(time, data, c='k', label='full measurement')
 
-maxima = argrelmax(data, order=order)[0]
-maxima_time = time[maxima]
-maxima_data = data[maxima]
+detector = PeakDetector(hysteresis, daq.samplerate / decimation)
+maxima_time, maxima_data = detector.update(data)
 
 ax.scatter(maxima_time, maxima_data, c='r', label='maxima')
 
-popt, pcov = curve_fit(exponential_decay,
-                       maxima_time, maxima_data,
-                       p0=[10, 0.1, 0])
+popt, fit_error = MyDAQ.fit_decay(maxima_time, maxima_data, p0=[10, 0.1, 0])
 
-fit_error = np.sqrt(np.diag(pcov))
 fit_label = f'Fit: C = {popt[0]:.2f} $\pm$ {fit_error[0]:.2f}, '
 fit_label += f'$\\tau$ = {popt[1]:.2f} $\pm$ {fit_error[1]:.2f}, '
 fit_label += f'offset = {popt[2]:.2f} $\pm$ {fit_error[2]:.2f}'
 
-ax.plot(time, exponential_decay(time, *popt), 'r--', label=fit_label)
+ax.plot(time, MyDAQ.decay_function(time, *popt), 'r--', label=fit_label)
 
 ax.set_xlabel('Time [s]')
 ax.set_ylabel('Voltage [V]')
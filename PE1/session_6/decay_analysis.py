@@ -1,21 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.signal import argrelmax
-from mydaq import MyDAQ
+from mydaq import MyDAQ, Decimator, PeakDetector
 import tkinter as tk
 from tkinter import filedialog
 import os
 
-
-def exponential_decay(t, C, tau, offset):
-    return C * np.exp(-t / tau) + offset
-
 # Important varialbles
-samplerate = 200_000
 frequency = 0.8
 duration = 60
-order = 100
+hysteresis = 0.1 # V, above the noise
+analysis_rate = 1000
 
 
 # Prompt save file
@@ -36,32 +30,39 @@ file_path = filedialog.askopenfilename(filetypes=[('Numpy files', '.npy')],
                                         title='Select data file',
                                         )
 
-data = np.load(file_path)[::213]
+raw = np.load(file_path, mmap_mode='r')
+
+# Full rate recordings are decimated in chunks, decay.py already saves 1 kS/s
+rate = round(len(raw) / duration)
+decimation = max(rate // analysis_rate, 1)
+if decimation > 1:
+    decimator = Decimator(decimation)
+    data = np.concatenate([decimator.update(raw[i:i + rate])
+                           for i in range(0, len(raw), rate)]
+                          + [decimator.flush()])
+else:
+    data = np.asarray(raw)
 
 
 # Analyse data
-time = MyDAQ.getTimeArray(duration, samplerate)[::213]
+time = MyDAQ.getTimeArray(duration, rate)[::decimation]
 
 fig, ax = plt.subplots(dpi=300, figsize=(16, 9))
 
 ax.scatter(time, data, c='k', label='full measurement')
 
-maxima = argrelmax(data, order=order)[0]
-maxima_time = time[maxima]
-maxima_data = data[maxima]
+detector = PeakDetector(hysteresis, rate / decimation)
+maxima_time, maxima_data = detector.update(data)
 
 ax.scatter(maxima_time, maxima_data, c='r', label='maxima')
 
-popt, pcov = curve_fit(exponential_decay,
-                       maxima_time, maxima_data,
-                       p0=[10, 0.1, 0])
+popt, fit_error = MyDAQ.fit_decay(maxima_time, maxima_data, p0=[10, 0.1, 0])
 
-fit_error = np.sqrt(np.diag(pcov))
 fit_label = f'Fit: C = {popt[0]:.2f} $\pm$ {fit_error[0]:.2f}, '
 fit_label += f'$\\tau$ = {popt[1]:.2f} $\pm$ {fit_error[1]:.2f}, '
 fit_label += f'offset = {popt[2]:.2f} $\pm$ {fit_error[2]:.2f}'
 
-ax.plot(time, exponential_decay(time, *popt), 'r--', label=fit_label)
+ax.plot(time, MyDAQ.decay_function(time, *popt), 'r--', label=fit_label)
 
 ax.set_xlabel('Time [s]')
 ax.set_ylabel('Voltage [V]')
@@ -37,15 +37,15 @@ savefile = filedialog.asksaveasfilename(filetypes=[('Numpy files', '.npy')],
 # Start of the measurement code
 repeat = 3
 
-daq = MyDAQ(200_000, 'myDAQ3')
-
 frequencies = np.linspace(0.6, 1, 15)
 
-data = daq.measure_spectrum(frequencies,
-                            duration=10,
-                            amplitude=10,
-                            repeat=repeat,
-                            )
+# Closes the cached tasks when done, also if the measurement fails
+with MyDAQ(200_000, 'myDAQ3') as daq:
+    data = daq.measure_spectrum(frequencies,
+                                duration=10,
+                                amplitude=10,
+                                repeat=repeat,
+                                )
 
 # Save data
 np.save(savefile, data)
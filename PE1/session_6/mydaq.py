@@ -12,19 +12,627 @@ Institution: Leiden University
 Student number: s2653346
 """
 
+import asyncio
+import json
+import os
+import queue
 import numpy as np
 import nidaqmx as dx
-from time import sleep
-from scipy.signal import sawtooth, square
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from nidaqmx.stream_readers import (AnalogMultiChannelReader,
+                                    AnalogSingleChannelReader)
+from nidaqmx.stream_writers import (AnalogMultiChannelWriter,
+                                    AnalogSingleChannelWriter)
+from scipy.optimize import curve_fit
+from scipy.signal import firwin, sawtooth, square, upfirdn
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 
+class LockIn():
+    """A digital lock-in amplifier for one known frequency.
+    
+    The signal is multiplied with a complex reference at the frequency and
+    summed, one chunk at a time, so it can run on the chunks of MyDAQ.stream
+    while the acquisition continues. Only a reference of at most chunk_size
+    samples is allocated. The value equals the DFT of all data so far at the
+    frequency, so for a frequency on an FFT bin it equals that bin of
+    np.fft.fft.
+    
+    parameters
+    ----------
+    frequency : float
+        The frequency to demodulate at
+    samplerate : int
+        The samplerate of the data
+    chunk_size : int
+        The maximum number of samples demodulated at once
+    """
+    def __init__(self, frequency: float, samplerate: int,
+                 chunk_size: int =65_536):
+        self.frequency = frequency
+        self.samplerate = samplerate
+        self.chunk_size = chunk_size
+        self.reset()
+    
+    def reset(self) -> None:
+        """Forget all data, to start a new measurement."""
+        self.__samples = 0
+        self.__value = 0j
+    
+    @property
+    def samples(self) -> int:
+        """The number of samples per trace demodulated so far."""
+        return self.__samples
+    
+    @property
+    def value(self):
+        """The complex amplitude of every trace, like an FFT bin."""
+        return self.__value
+    
+    def update(self, chunk) -> None:
+        """Demodulate the next chunk of data.
+        
+        parameters
+        ----------
+        chunk : np.ndarray
+            The next samples, along the last axis. Other axes are separate
+            traces, for example (channels, samples).
+        """
+        chunk = np.asarray(chunk)
+        
+        for start in range(0, chunk.shape[-1], self.chunk_size):
+            part = chunk[..., start:start + self.chunk_size]
+            n = np.arange(self.__samples, self.__samples + part.shape[-1])
+            
+            # Only the fraction of a cycle matters, keeps the phase precise
+            cycles = np.mod(self.frequency * n / self.samplerate, 1)
+            self.__value = self.__value + part @ np.exp(-2j * np.pi * cycles)
+            self.__samples += part.shape[-1]
+
+
+class Decimator():
+    """An anti-aliased decimator for a stream of data.
+    
+    The data is low-pass filtered below the new Nyquist frequency with a
+    linear phase FIR filter and only every factor-th sample is kept. The
+    filter runs polyphase with scipy.signal.upfirdn, so only the kept
+    samples are computed, and the end of every chunk is kept for the next
+    one, so chunks of any size give the same result as the whole record at
+    once. The delay of the filter is compensated: output sample m belongs to
+    input sample m * factor, so the time axis is
+    MyDAQ.getTimeArray(duration, samplerate)[::factor]. Together with flush
+    the output equals np.convolve(data, taps, mode='same')[::factor].
+    
+    parameters
+    ----------
+    factor : int
+        The decimation factor
+    length : int
+        Half the length of the filter in output samples, the filter has
+        2 * length * factor + 1 taps. Longer filters have a sharper cut-off.
+        Default is 10.
+    cutoff : float
+        The cut-off frequency of the filter, as a fraction of the new Nyquist
+        frequency. Default is 0.8.
+    """
+    def __init__(self, factor: int, length: int =10, cutoff: float =0.8):
+        assert isinstance(factor, int) and factor > 0, \
+            "Factor should be a positive integer."
+        self.factor = factor
+        self.length = length
+        self.taps = firwin(2 * length * factor + 1, cutoff / factor)
+        self.reset()
+    
+    def reset(self) -> None:
+        """Forget all data, to start a new stream."""
+        self.__buffer = None
+    
+    def update(self, chunk) -> np.ndarray:
+        """Decimate the next chunk of data.
+        
+        parameters
+        ----------
+        chunk : np.ndarray
+            The next samples, along the last axis. Other axes are separate
+            traces, for example (channels, samples).
+        
+        returns
+        -------
+        np.ndarray
+            The output samples that are complete, may be empty. The last
+            output samples follow once the next chunk arrives.
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        
+        if self.__buffer is None:
+            # Zeros before the start, centres the filter on the first sample
+            delay = self.length * self.factor
+            self.__buffer = np.zeros(chunk.shape[:-1] + (delay,))
+        
+        buffer = np.concatenate([self.__buffer, chunk], axis=-1)
+        count = (buffer.shape[-1] - len(self.taps)) // self.factor + 1
+        if count <= 0:
+            self.__buffer = buffer
+            return np.empty(chunk.shape[:-1] + (0,))
+        used = (count - 1) * self.factor + len(self.taps)
+        
+        # Skip the outputs of upfirdn that overlap the start of the buffer
+        out = upfirdn(self.taps, buffer[..., :used], down=self.factor)
+        out = out[..., 2 * self.length:2 * self.length + count]
+        
+        self.__buffer = buffer[..., count * self.factor:]
+        return out
+    
+    def flush(self) -> np.ndarray:
+        """The last output samples, with zeros after the end of the data.
+        
+        returns
+        -------
+        np.ndarray
+            The remaining output samples
+        """
+        if self.__buffer is None:
+            return np.empty(0)
+        
+        delay = self.length * self.factor
+        out = self.update(np.zeros(self.__buffer.shape[:-1] + (delay,)))
+        self.reset()
+        return out
+
+
+class PeakDetector():
+    """A peak detector with hysteresis for a stream of data.
+    
+    The detector follows the running maximum of the signal. Once the signal
+    drops hysteresis below it, the maximum is a peak and the detector
+    follows the running minimum instead, until the signal rises hysteresis
+    above that. Noise smaller than hysteresis therefore never gives a false
+    peak, and unlike a fixed threshold this keeps working while the
+    amplitude of an oscillation decays. The state is kept between chunks,
+    so only the peaks are stored, whatever the length of the stream.
+    
+    parameters
+    ----------
+    hysteresis : float
+        How far the signal has to move back from an extreme before it counts
+        as a peak, larger than the noise but smaller than the oscillation
+    samplerate : float
+        The samplerate of the data, to give the peak times in seconds
+    """
+    def __init__(self, hysteresis: float, samplerate: float):
+        self.hysteresis = hysteresis
+        self.samplerate = samplerate
+        self.reset()
+    
+    def reset(self) -> None:
+        """Forget all data and peaks, to start a new stream."""
+        self.__samples = 0
+        self.__rising = True
+        self.__extreme = -np.inf
+        self.__index = 0
+        self.__peaks = []
+    
+    @property
+    def times(self) -> np.ndarray:
+        """The times of all peaks so far in seconds."""
+        return np.asarray([index for index, _ in self.__peaks]) \
+            / self.samplerate
+    
+    @property
+    def amplitudes(self) -> np.ndarray:
+        """The values of the signal at all peaks so far."""
+        return np.asarray([value for _, value in self.__peaks])
+    
+    def _follow(self, signal: np.ndarray, start: int):
+        """Follow the running maximum of signal from start.
+        
+        The signal is searched in windows that double in size, so finding
+        the next turn takes time in proportion to its distance.
+        
+        returns
+        -------
+        int | None
+            The index where signal drops hysteresis below the running
+            maximum, None if it does not within signal
+        """
+        width = 64
+        while start < len(signal):
+            part = signal[start:start + width]
+            running = np.maximum(np.maximum.accumulate(part), self.__extreme)
+            drop = part < running - self.hysteresis
+            
+            end = np.argmax(drop) if drop.any() else len(part)
+            if end > 0 and part[:end].max() > self.__extreme:
+                self.__index = self.__samples + start + np.argmax(part[:end])
+                self.__extreme = part[:end].max()
+            
+            if end < len(part):
+                return start + end
+            start += width
+            width *= 2
+        return None
+    
+    def update(self, chunk) -> tuple:
+        """Find the peaks in the next chunk of data.
+        
+        parameters
+        ----------
+        chunk : np.ndarray
+            The next samples of one channel
+        
+        returns
+        -------
+        np.ndarray
+            The times of the peaks completed in this chunk in seconds
+        np.ndarray
+            The values of the signal at these peaks
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        assert chunk.ndim == 1, "Peaks can only be found in one channel."
+        
+        # Minima are followed as the maxima of the negative signal
+        signals = {True: chunk, False: -chunk}
+        found = len(self.__peaks)
+        
+        start = 0
+        while True:
+            turn = self._follow(signals[self.__rising], start)
+            if turn is None:
+                break
+            
+            if self.__rising:
+                self.__peaks.append((self.__index, self.__extreme))
+            
+            self.__rising = not self.__rising
+            self.__extreme = signals[self.__rising][turn]
+            self.__index = self.__samples + turn
+            start = turn + 1
+        
+        self.__samples += len(chunk)
+        
+        peaks = self.__peaks[found:]
+        return (np.asarray([index for index, _ in peaks]) / self.samplerate,
+                np.asarray([value for _, value in peaks]))
+
+
+class ScaledArray():
+    """Raw ADC codes that are converted to volts when they are indexed.
+    
+    Raw int16 data takes a quarter of the memory and disk space of float64
+    volts. Indexing converts only the selected part, so a large (memory
+    mapped) dataset can be analysed one piece at a time, for example
+    MyDAQ.get_transfer_functions(data[:, i], ...) per repeat. np.asarray
+    converts everything at once.
+    
+    parameters
+    ----------
+    raw : np.ndarray
+        The raw codes, with the channels on the first axis
+    coefficients : np.ndarray
+        The scaling polynomial of every channel, with shape (channels,
+        terms), in order of increasing power
+    """
+    def __init__(self, raw: np.ndarray, coefficients):
+        self.raw = raw
+        self.coefficients = np.atleast_2d(coefficients)
+        assert len(self.coefficients) == len(raw), \
+            "Coefficients should be given for every channel."
+    
+    @property
+    def shape(self) -> tuple:
+        return self.raw.shape
+    
+    @property
+    def ndim(self) -> int:
+        return self.raw.ndim
+    
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+    
+    def __len__(self) -> int:
+        return len(self.raw)
+    
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        
+        channels = np.arange(len(self.raw))[key[0] if key else slice(None)]
+        raw = self.raw[key]
+        
+        if channels.ndim == 0:
+            return MyDAQ.to_volts(raw, self.coefficients[channels])
+        
+        volts = np.empty(raw.shape)
+        for i, channel in enumerate(channels):
+            volts[i] = MyDAQ.to_volts(raw[i], self.coefficients[channel])
+        return volts
+    
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        volts = self[:]
+        return volts if dtype is None else volts.astype(dtype)
+
+
+class SweepDataset():
+    """A sweep saved by MyDAQ.measure_spectrum with checkpoint.
+    
+    The directory holds metadata.json with the acquisition settings (the
+    measured frequencies, samplerate and samples per frequency, duration,
+    amplitude, repeat, method, channels and whether the traces are raw ADC
+    codes), and one file per (repeat, frequency) trace. Every trace is read
+    on its own, memory mapped where possible, so a sweep can be analysed
+    without loading it whole, and several processes or threads can read
+    from it at the same time. compress() stores the traces compressed.
+    
+    parameters
+    ----------
+    path : str
+        The directory of the sweep
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'metadata.json')) as file:
+            self.metadata = json.load(file)
+        
+        for key in ('frequencies', 'samplerate', 'samples'):
+            self.metadata[key] = np.asarray(self.metadata[key])
+        
+        self.scaling = None
+        if self.metadata['raw']:
+            self.scaling = np.load(os.path.join(path, 'scaling.npy'))
+    
+    @property
+    def frequencies(self) -> np.ndarray:
+        return self.metadata['frequencies']
+    
+    @property
+    def samplerate(self) -> np.ndarray:
+        return self.metadata['samplerate']
+    
+    @property
+    def repeat(self) -> int:
+        return self.metadata['repeat']
+    
+    @property
+    def shape(self) -> tuple:
+        """The shape without the samples axis, (2, repeat, frequencies)."""
+        return (2, self.repeat, len(self.frequencies))
+    
+    @property
+    def complete(self) -> bool:
+        """Whether every trace of the sweep was saved."""
+        return all(self._file(i, j) is not None
+                   for i in range(self.repeat)
+                   for j in range(len(self.frequencies)))
+    
+    def _file(self, repeat: int, frequency: int):
+        """The saved file of one trace, None if it was not saved."""
+        path = MyDAQ._checkpointFile(self.path, repeat, frequency)
+        for path in (path, path.replace('.npy', '.npz')):
+            if os.path.exists(path):
+                return path
+        return None
+    
+    def read(self, repeat: int, frequency: int, mmap_mode='r') -> np.ndarray:
+        """Read one trace, in volts.
+        
+        parameters
+        ----------
+        repeat : int
+            The index of the repeat
+        frequency : int
+            The index of the frequency
+        mmap_mode : str
+            Passed to np.load for uncompressed traces, default is 'r'
+        
+        returns
+        -------
+        np.ndarray
+            The trace, with shape (2, samples), index 0 is the input and
+            index 1 the output
+        
+        raises
+        ------
+        KeyError
+            If the trace was not saved
+        """
+        path = self._file(repeat, frequency)
+        if path is None:
+            raise KeyError(f"Repeat {repeat}, frequency {frequency} is not "
+                           f"in {self.path}")
+        
+        if path.endswith('.npz'):
+            with np.load(path) as file:
+                trace = file['trace']
+        else:
+            trace = np.load(path, mmap_mode=mmap_mode)
+        
+        if self.scaling is not None:
+            return ScaledArray(trace, self.scaling)[:]
+        return trace
+    
+    def __getitem__(self, key) -> np.ndarray:
+        return self.read(*key)
+    
+    def traces(self):
+        """Yield (repeat, frequency, trace) for every saved trace."""
+        for i in range(self.repeat):
+            for j in range(len(self.frequencies)):
+                if self._file(i, j) is not None:
+                    yield i, j, self.read(i, j)
+    
+    def load(self) -> np.ndarray:
+        """Load the whole sweep in volts, shaped like measure_spectrum."""
+        samples = self.metadata['samples']
+        if np.all(samples == samples[0]):
+            data = np.empty(self.shape + (samples[0],))
+        else:
+            data = np.empty(self.shape, dtype=object)
+        
+        for i in range(self.repeat):
+            for j in range(len(self.frequencies)):
+                trace = self.read(i, j)
+                data[0, i, j] = trace[0]
+                data[1, i, j] = trace[1]
+        
+        return data[:, 0] if self.repeat == 1 else data
+    
+    def compress(self) -> None:
+        """Store every uncompressed trace compressed, in its own .npz file."""
+        for i in range(self.repeat):
+            for j in range(len(self.frequencies)):
+                path = self._file(i, j)
+                if path is None or path.endswith('.npz'):
+                    continue
+                
+                compressed = path.replace('.npy', '.npz')
+                temporary = path.replace('.npy', '.tmp.npz')
+                np.savez_compressed(temporary, trace=np.load(path))
+                os.replace(temporary, compressed)
+                os.remove(path)
+
+
+class SweepLoader():
+    """Lazily load a sweep saved with np.save by the measurement scripts.
+    
+    The files are memory mapped, so only the traces that are used are read
+    from disk, and trim is applied as a view. The sweep is path, with shape
+    (2, frequencies, samples) for a single repeat or (2, repeat,
+    frequencies, samples), followed by any path_1.npy, path_2.npy, ... with
+    further repeats, and the frequencies in path_frequencies.npy.
+    
+    parameters
+    ----------
+    path : str
+        The first file of the sweep
+    trim : slice
+        The part of every trace to keep, for example
+        slice(None, -samplerate//10) to drop the last 100 ms. Default is
+        slice(None), the whole trace.
+    """
+    def __init__(self, path: str, trim: slice =slice(None)):
+        self.path = path
+        self.trim = trim
+        self.frequencies = np.load(path.replace('.npy', '_frequencies.npy'))
+        
+        self.__files = []
+        i = 0
+        while os.path.exists(path):
+            data = np.load(path, mmap_mode='r')
+            if data.ndim == 3:
+                data = data[:, None]
+            self.__files.append(data)
+            
+            i += 1
+            path = self.path.replace('.npy', f'_{i}.npy')
+        
+        # repeat -> (file, repeat in file)
+        self.__index = [(data, j) for data in self.__files
+                        for j in range(data.shape[1])]
+    
+    @property
+    def repeat(self) -> int:
+        return len(self.__index)
+    
+    @property
+    def shape(self) -> tuple:
+        """The shape of the trimmed sweep, (2, repeat, frequencies, samples)."""
+        data, _ = self.__index[0]
+        samples = len(range(data.shape[-1])[self.trim])
+        return (2, self.repeat, len(self.frequencies), samples)
+    
+    def repeat_view(self, repeat: int) -> np.ndarray:
+        """The trimmed view of one repeat, (2, frequencies, samples)."""
+        data, j = self.__index[repeat]
+        return data[:, j, :, self.trim]
+    
+    def __getitem__(self, key) -> np.ndarray:
+        """The trimmed view of sweep[repeat, frequency], (2, samples)."""
+        repeat, frequency = key
+        return self.repeat_view(repeat)[:, frequency]
+    
+    def transfer_functions(self, samplerate: int =200_000,
+                           integration_range: int =0,
+                           method: str ='fft',
+                           repeat=None,
+                           ) -> np.ndarray:
+        """Calculate the transfer functions one trace at a time.
+        
+        Only one trace is in memory at a time, so this works for sweeps that
+        are larger than the memory. See MyDAQ.get_transfer_functions for the
+        other parameters.
+        
+        parameters
+        ----------
+        repeat : int
+            The number of repeats to analyse, the first ones. If None, all
+            repeats that were found.
+        
+        returns
+        -------
+        np.ndarray
+            The transfer functions, shape (repeat, frequencies)
+        """
+        if repeat is None:
+            repeat = self.repeat
+        assert repeat <= self.repeat, \
+            f"Only {self.repeat} repeats were found for {self.path}."
+        
+        transfer = np.empty((repeat, len(self.frequencies)), dtype=complex)
+        
+        for i in range(repeat):
+            for j, frequency in enumerate(self.frequencies):
+                transfer[i, j] = MyDAQ.get_transfer_functions(
+                    self[i, j][:, None],
+                    [frequency],
+                    samplerate=samplerate,
+                    integration_range=integration_range,
+                    method=method,
+                ).ravel()[0]
+        
+        return transfer
+
+
 class MyDAQ():
     """A class to controll the MyDAQ"""
-    def __init__(self, samplerate: int, name: str='myDAQ2'):
+    def __init__(self, samplerate: int, name: str='myDAQ2',
+                 cache_size: int =4):
         self.finite = dx.constants.AcquisitionType.FINITE
+        self.continuous = dx.constants.AcquisitionType.CONTINUOUS
         self.__samplerate = samplerate
         self.__name = name
+        
+        # Configured AO/AI task pairs, reused across readWrite calls, least
+        # recently used first
+        self.__tasks = OrderedDict()
+        self.__cacheSize = cache_size
+        self.__activeTasks = None
+        self.__alignment_offset = None
+        self.__raw_scaling = None
+        self.__readBuffer = None
+        self.__rawBuffer = None
+        self.__writeBuffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # nidaqmx does not close tasks that are garbage collected, and the
+        # cached tasks keep the device reserved
+        self.close()
+
+    def close(self) -> None:
+        """Close all cached tasks and release the hardware."""
+        for writeTask, readTask in self.__tasks.values():
+            writeTask.close()
+            readTask.close()
+        
+        self.__tasks = OrderedDict()
+        self.__activeTasks = None
 
     @property
     def samplerate(self) -> int:
@@ -45,6 +653,18 @@ class MyDAQ():
         assert isinstance(new_name, str), "Name should be a string."
         self.__name = new_name
 
+    @property
+    def raw_scaling(self):
+        """Scaling coefficients of the channels of the last raw read, with
+        shape (channels, terms), see to_volts. None if nothing was read raw."""
+        return self.__raw_scaling
+
+    @property
+    def alignment_offset(self):
+        """Offset in samples between written and read data of the last
+        readWrite with measure_offset=True, None if not measured."""
+        return self.__alignment_offset
+
     @staticmethod
     def convertDurationToSamples(samplerate: int, duration: float) -> int:
         samples = duration * samplerate
@@ -115,7 +735,12 @@ class MyDAQ():
             else:
                 task.ai_channels.add_ai_voltage_chan(f"{self.name}/{channel}")
 
-    def _configureChannelTimings(self, task: dx.task.Task, samples: int) -> None:
+    def _configureChannelTimings(self,
+                                 task: dx.task.Task,
+                                 samples: int,
+                                 rate=None,
+                                 sample_mode=None,
+                                 ) -> None:
         """Set the correct timings for task based on number of samples
         
         parameters
@@ -123,156 +748,1937 @@ class MyDAQ():
         task : dx.task.Task
             The task to set the timing for
         samples : int
-            The number of samples to read or write
+            The number of samples to read or write. For continuous tasks this
+            sets the buffer size.
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        sample_mode : dx.constants.AcquisitionType
+            The acquisition type, if None the task is finite
         """
-        assert not (self.samplerate is None), "Samplerate should be set first."
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        if sample_mode is None:
+            sample_mode = self.finite
 
         task.timing.cfg_samp_clk_timing(
-            self.samplerate,
-            sample_mode=self.finite,
+            rate,
+            sample_mode=sample_mode,
             samps_per_chan=samples,
         )
 
+    @staticmethod
+    def _channelKey(channels) -> tuple:
+        """Make a hashable key from one or multiple channel names."""
+        if isinstance(channels, str):
+            return (channels,)
+        return tuple(channels)
+
+    def _getTaskPair(self, write_channel, read_channel, rate: int, samps: int):
+        """Get a configured AO/AI task pair from the task cache.
+        
+        Creating a task, adding its channels and configuring its timing is
+        slow compared to a short measurement. Task pairs are therefore cached
+        on (device, channels, rate, samples), so repeated calls with the same
+        settings only have to reprogram the write buffer. Only the pair that
+        was used last keeps the hardware reserved. At most cache_size pairs
+        are kept, the least recently used pair is closed to make room, so
+        sweeps with a different length or rate per frequency do not leave a
+        pair of tasks open for every frequency.
+        
+        The read task is started by the start trigger of the write task, so
+        both tasks start on the same sample clock edge.
+        
+        parameters
+        ----------
+        write_channel : str | list[str]
+            The channel(s) to write to
+        read_channel : str | list[str]
+            The channel(s) to read from
+        rate : int
+            The sample rate in Hz
+        samps : int
+            The number of samples to read and write
+        
+        returns
+        -------
+        writeTask : dx.task.Task
+            The committed output task
+        readTask : dx.task.Task
+            The committed input task
+        """
+        key = (self.name,
+               MyDAQ._channelKey(write_channel),
+               MyDAQ._channelKey(read_channel),
+               rate,
+               samps,
+               )
+        
+        if key not in self.__tasks:
+            if len(self.__tasks) >= self.__cacheSize:
+                self._closeTaskPair(next(iter(self.__tasks)))
+            
+            # DAQmx picks unique names, also next to other MyDAQ instances
+            writeTask = dx.Task()
+            readTask = dx.Task()
+            
+            self._addOutputChannels(writeTask, write_channel)
+            self._addInputChannels(readTask, read_channel)
+            
+            self._configureChannelTimings(writeTask, samps, rate)
+            self._configureChannelTimings(readTask, samps, rate)
+            readTask.triggers.start_trigger.cfg_dig_edge_start_trig(
+                f'/{self.name}/ao/StartTrigger'
+            )
+            
+            self.__tasks[key] = (writeTask, readTask)
+        
+        if self.__activeTasks != key:
+            # Only one pair can hold the hardware at a time
+            self._releaseTasks()
+            
+            # Committing keeps the task configured in hardware after stop()
+            for task in self.__tasks[key]:
+                task.control(dx.constants.TaskMode.TASK_COMMIT)
+            self.__activeTasks = key
+        
+        self.__tasks.move_to_end(key)
+        return self.__tasks[key]
+
+    def _closeTaskPair(self, key) -> None:
+        """Close a cached task pair and remove it from the cache."""
+        if self.__activeTasks == key:
+            self._releaseTasks()
+        
+        for task in self.__tasks.pop(key):
+            task.close()
+
+    def _releaseTasks(self) -> None:
+        """Unreserve the cached task pair so other tasks can use the device."""
+        if self.__activeTasks is not None:
+            for task in self.__tasks[self.__activeTasks]:
+                task.control(dx.constants.TaskMode.TASK_UNRESERVE)
+            self.__activeTasks = None
+
+    @staticmethod
+    def _makeReader(task: dx.task.Task, channels: int):
+        """Make a stream reader that reads straight into numpy arrays.
+        
+        parameters
+        ----------
+        task : dx.task.Task
+            The task to read from
+        channels : int
+            The number of channels in the task
+        
+        returns
+        -------
+        AnalogSingleChannelReader | AnalogMultiChannelReader
+            A reader for 1D arrays for a single channel, 2D arrays with shape
+            (channels, samples) otherwise.
+        """
+        if channels == 1:
+            return AnalogSingleChannelReader(task.in_stream)
+        return AnalogMultiChannelReader(task.in_stream)
+
+    def _readInto(self, reader, out: np.ndarray, timeout: float) -> None:
+        """Read out.shape[-1] samples per channel into out.
+        
+        Stream readers need C-contiguous float64 arrays. Other arrays, like a
+        slice of a bigger dataset, are filled through a reused buffer.
+        
+        parameters
+        ----------
+        reader : AnalogSingleChannelReader | AnalogMultiChannelReader
+            The reader to read with, see _makeReader
+        out : np.ndarray
+            The array to read into
+        timeout : float
+            The timeout in seconds for the read operation
+        """
+        if out.flags.c_contiguous and out.dtype == np.float64:
+            buffer = out
+        else:
+            if self.__readBuffer is None or self.__readBuffer.shape != out.shape:
+                self.__readBuffer = np.empty(out.shape)
+            buffer = self.__readBuffer
+        
+        reader.read_many_sample(buffer,
+                                number_of_samples_per_channel=out.shape[-1],
+                                timeout=timeout,
+                                )
+        
+        if buffer is not out:
+            out[...] = buffer
+
+    def _readRawInto(self,
+                     task: dx.task.Task,
+                     out: np.ndarray,
+                     timeout: float,
+                     ) -> None:
+        """Read out.shape[-1] raw int16 samples per channel into out.
+        
+        The device returns the samples of all channels interleaved, they are
+        read into a reused buffer and then sorted per channel. The scaling
+        coefficients of the channels are stored in raw_scaling.
+        
+        parameters
+        ----------
+        task : dx.task.Task
+            The task to read from
+        out : np.ndarray
+            The int16 array to read into, with shape (samples,) or
+            (channels, samples)
+        timeout : float
+            The timeout in seconds for the read operation
+        """
+        channels = list(task.ai_channels)
+        size = len(channels) * out.shape[-1]
+        
+        if self.__rawBuffer is None or self.__rawBuffer.size != size:
+            self.__rawBuffer = np.empty(size, dtype=np.int16)
+        
+        task.in_stream.timeout = timeout
+        task.in_stream.read_into(self.__rawBuffer)
+        
+        out[...] = self.__rawBuffer.reshape(out.shape[-1], len(channels)).T \
+            .reshape(out.shape)
+        self.__raw_scaling = np.asarray([channel.ai_dev_scaling_coeff
+                                         for channel in channels])
+
+    @staticmethod
+    def _dataShape(channels, samps: int) -> tuple:
+        """The shape of data for channels, (samps,) or (channels, samps)."""
+        nchannels = len(MyDAQ._channelKey(channels))
+        return (samps,) if nchannels == 1 else (nchannels, samps)
+
+    def _writeFrom(self,
+                   task: dx.task.Task,
+                   write_data,
+                   channels,
+                   timeout: float =10.,
+                   ) -> None:
+        """Write data into the output buffer of a task, without starting it.
+        
+        The data is written with a stream writer from a C-contiguous float64
+        array. Other data is first copied into a reused buffer.
+        
+        parameters
+        ----------
+        task : dx.task.Task
+            The task to write to
+        write_data : array
+            The voltage data, with shape (samples,) for one channel and
+            (channels, samples) otherwise
+        channels : str | list[str]
+            The channel(s) of the task
+        timeout : float
+            The timeout in seconds for the write operation. Default is 10.
+        """
+        nchannels = len(MyDAQ._channelKey(channels))
+        
+        if (isinstance(write_data, np.ndarray)
+                and write_data.flags.c_contiguous
+                and write_data.dtype == np.float64):
+            data = write_data
+        else:
+            shape = np.shape(write_data)
+            if self.__writeBuffer is None or self.__writeBuffer.shape != shape:
+                self.__writeBuffer = np.empty(shape)
+            data = self.__writeBuffer
+            data[...] = write_data
+        
+        assert data.shape == MyDAQ._dataShape(channels, data.shape[-1]), \
+            "Write data should have shape (samples,) or (channels, samples)."
+        
+        if nchannels == 1:
+            writer = AnalogSingleChannelWriter(task.out_stream)
+        else:
+            writer = AnalogMultiChannelWriter(task.out_stream)
+        writer.write_many_sample(data, timeout=timeout)
+
     def readWrite(self, write_data, rate=None, samps=None, 
                   read_channel='ai0',
-                  write_channel='ao0'
+                  write_channel='ao0',
+                  timeout=None,
+                  measure_offset: bool =False,
+                  out=None,
+                  raw: bool =False,
                   ) -> np.ndarray:
         """Reads and writes data to the MyDAQ.
         
+        Reading is triggered by the start of writing, so the first read sample
+        is taken at the same clock edge as the first written sample and the
+        full record can be used.
+        
+        parameters
+        ----------
+        write_data : array
+            The voltage data to write to the MyDAQ, with shape (samples,) for
+            one write channel and (channels, samples) otherwise
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        samps : int
+            The number of samples to read and write. If None, all of write_data
+            is written, and the length of write_data is read. If not None, the 
+            length of write_data is written and repeated for the ammount of
+            samples requested.
+        read_channel : str
+            The channel to read from, default is 'ai0'
+        write_channel : str | list[str]
+            The channel(s) to write to, default is 'ao0'
+        timeout : float
+            The timeout in seconds for the read operation. If None, the
+            duration of the measurement plus 10 seconds.
+        measure_offset : bool
+            Whether to measure the offset between write_data and the first
+            read channel, see find_alignment_offset. The result is stored in
+            the alignment_offset attribute. Default is False.
+        out : np.ndarray
+            The array to read into, with shape (samps,) for one read channel
+            and (channels, samps) otherwise. Reusing one array between calls
+            avoids allocating new memory for every measurement. If None, a
+            new array is made.
+        raw : bool
+            Whether to read the raw int16 ADC codes instead of volts. The
+            coefficients to convert them with to_volts are stored in the
+            raw_scaling attribute. Default is False.
+
+        returns
+        -------
+        np.ndarray
+            The data read from the MyDAQ
+        """
+        writeTask, readTask, out, timeout = self._prepareReadWrite(
+            write_data, rate, samps, read_channel, write_channel, timeout, out,
+            np.int16 if raw else np.float64,
+        )
+        
+        try:
+            # Arm the read task first, it waits for the write task to start
+            readTask.start()
+            writeTask.start()
+            if raw:
+                self._readRawInto(readTask, out, timeout)
+            else:
+                reader = MyDAQ._makeReader(readTask,
+                                           len(MyDAQ._channelKey(read_channel)))
+                self._readInto(reader, out, timeout)
+        finally:
+            readTask.stop()
+            writeTask.stop()
+        
+        if measure_offset:
+            self._measureOffset(write_data, out)
+        
+        return out
+
+    async def readWrite_async(self, write_data, rate=None, samps=None,
+                              read_channel='ai0',
+                              write_channel='ao0',
+                              timeout=None,
+                              measure_offset: bool =False,
+                              out=None,
+                              ) -> np.ndarray:
+        """Reads and writes data to the MyDAQ without blocking the event loop.
+        
+        Works like readWrite, but waits for the acquisition with a task done
+        event, so other coroutines (for example for another MyDAQ) run in the
+        meantime. See readWrite for the parameters.
+        
+        returns
+        -------
+        np.ndarray
+            The data read from the MyDAQ
+        """
+        writeTask, readTask, out, timeout = self._prepareReadWrite(
+            write_data, rate, samps, read_channel, write_channel, timeout, out
+        )
+        
+        done = MyDAQ._doneFuture(readTask)
+        try:
+            readTask.start()
+            writeTask.start()
+            await asyncio.wait_for(done, timeout)
+            
+            # All samples are in the buffer, so this does not block
+            reader = MyDAQ._makeReader(readTask,
+                                       len(MyDAQ._channelKey(read_channel)))
+            self._readInto(reader, out, timeout)
+        finally:
+            readTask.stop()
+            writeTask.stop()
+            readTask.register_done_event(None)
+        
+        if measure_offset:
+            self._measureOffset(write_data, out)
+        
+        return out
+
+    def _prepareReadWrite(self, write_data, rate, samps, read_channel,
+                          write_channel, timeout, out, dtype=np.float64):
+        """Get the task pair for readWrite and write the data to it.
+        
+        Fills in the defaults for rate, samps, timeout and out as described in
+        readWrite, a new out array gets the given dtype.
+        
+        returns
+        -------
+        writeTask : dx.task.Task
+            The output task, with write_data in its buffer
+        readTask : dx.task.Task
+            The input task
+        out : np.ndarray
+            The array to read into
+        timeout : float
+            The timeout in seconds for the read operation
+        """
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        if samps is None:
+            samps = np.shape(write_data)[-1]
+        
+        if timeout is None:
+            timeout = MyDAQ.convertSamplesToDuration(rate, samps) + 10
+        
+        if out is None:
+            out = np.empty(MyDAQ._dataShape(read_channel, samps), dtype=dtype)
+        assert out.shape == MyDAQ._dataShape(read_channel, samps), \
+            "Out should have shape (samps,) or (channels, samps)."
+        
+        writeTask, readTask = self._getTaskPair(write_channel,
+                                                read_channel,
+                                                rate,
+                                                samps,
+                                                )
+        self._writeFrom(writeTask, write_data, write_channel, timeout)
+        
+        return writeTask, readTask, out, timeout
+
+    def _measureOffset(self, write_data, read_data) -> None:
+        """Store the offset between the first written and read channel."""
+        self.__alignment_offset = MyDAQ.find_alignment_offset(
+            write_data if np.ndim(write_data) == 1 else write_data[0],
+            read_data if read_data.ndim == 1 else read_data[0],
+        )
+
+    @staticmethod
+    def _doneFuture(task: dx.task.Task) -> asyncio.Future:
+        """Make a future that is resolved by the done event of a task.
+        
+        Must be called from a running event loop, before the task is started.
+        The event should be unregistered with task.register_done_event(None)
+        after the task is stopped.
+        
+        parameters
+        ----------
+        task : dx.task.Task
+            The finite task to wait for
+        
+        returns
+        -------
+        asyncio.Future
+            Resolves to the status code of the task when it is done
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        
+        def setDone(status):
+            if not done.done():
+                done.set_result(status)
+        
+        # Called from a DAQmx thread, so hand the result over to the loop
+        def callback(task_handle, status, callback_data):
+            loop.call_soon_threadsafe(setDone, status)
+            return 0
+        
+        task.register_done_event(callback)
+        return done
+
+    def read(self, duration: float, rate=None, channel='ai0',
+             timeout:float =300., out=None, decimate=None) -> np.ndarray:
+        """Reads data from the MyDAQ.
+        
+        With decimate the data is read with stream and decimated chunk by
+        chunk (see Decimator), so only the decimated data is kept in memory.
+        
+        parameters
+        ----------
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        duration : float
+            The duration in seconds to read data for
+        channel : str
+            The channel to read from, default is 'ai0'
+        timeout : float
+            The timeout in seconds for the read operation. Default is 300.
+        out : np.ndarray
+            The array to read into, with shape (samples,) for one channel and
+            (channels, samples) otherwise. If None, a new array is made.
+        decimate : int
+            The factor to decimate by, the result then has
+            ceil(samples / decimate) samples at getTimeArray(duration,
+            rate)[::decimate]. Default is None, no decimation.
+        
+        returns
+        -------
+        np.ndarray
+            The data read from the MyDAQ
+        """
+        if rate is None:
+                rate = self.samplerate
+                assert rate is not None, "Samplerate should be set first."
+        
+        samps = MyDAQ.convertDurationToSamples(rate, duration)
+        
+        if decimate is not None:
+            samps = -(-samps // decimate)
+            if out is None:
+                out = np.empty(MyDAQ._dataShape(channel, samps))
+            assert out.shape == MyDAQ._dataShape(channel, samps), \
+                "Out should have shape (samples,) or (channels, samples)."
+            
+            start = 0
+            for chunk in self.stream(channel, rate, duration=duration,
+                                     timeout=timeout, decimate=decimate):
+                out[..., start:start + chunk.shape[-1]] = chunk
+                start += chunk.shape[-1]
+            return out
+        
+        if out is None:
+            out = np.empty(MyDAQ._dataShape(channel, samps))
+        assert out.shape == MyDAQ._dataShape(channel, samps), \
+            "Out should have shape (samples,) or (channels, samples)."
+        
+        self._releaseTasks()
+
+        with dx.Task() as readTask:
+            self._addInputChannels(readTask, channel)
+            self._configureChannelTimings(readTask, samps, rate)
+
+            reader = MyDAQ._makeReader(readTask,
+                                       len(MyDAQ._channelKey(channel)))
+            self._readInto(reader, out, timeout)
+            return out
+
+    async def read_async(self, duration: float, rate=None, channel='ai0',
+                         timeout:float =300., out=None) -> np.ndarray:
+        """Reads data from the MyDAQ without blocking the event loop.
+        
+        Works like read, but waits for the acquisition with a task done
+        event. See read for the parameters.
+        
+        returns
+        -------
+        np.ndarray
+            The data read from the MyDAQ
+        """
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        samps = MyDAQ.convertDurationToSamples(rate, duration)
+        
+        if out is None:
+            out = np.empty(MyDAQ._dataShape(channel, samps))
+        assert out.shape == MyDAQ._dataShape(channel, samps), \
+            "Out should have shape (samples,) or (channels, samples)."
+        
+        self._releaseTasks()
+        
+        with dx.Task() as readTask:
+            self._addInputChannels(readTask, channel)
+            self._configureChannelTimings(readTask, samps, rate)
+            
+            done = MyDAQ._doneFuture(readTask)
+            try:
+                readTask.start()
+                await asyncio.wait_for(done, timeout)
+                
+                reader = MyDAQ._makeReader(readTask,
+                                           len(MyDAQ._channelKey(channel)))
+                self._readInto(reader, out, timeout)
+            finally:
+                readTask.stop()
+                readTask.register_done_event(None)
+            
+            return out
+
+    def stream(self, channels='ai0', rate=None, chunk_size=None,
+               duration=None, timeout: float =10., decimate=None):
+        """Continuously read data from the MyDAQ in chunks.
+        
+        The chunks are read into one preallocated array, so memory use does
+        not grow with the duration and every chunk can be processed while the
+        acquisition continues. Note that the same array is yielded every time,
+        copy it if it should be kept.
+        
+        With decimate every chunk is decimated with a Decimator as it
+        arrives, and only the decimated chunks are yielded, as new arrays.
+        
+        parameters
+        ----------
+        channels : str | list[str]
+            The channel(s) to read from, default is 'ai0'
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        chunk_size : int
+            The number of samples per channel in every chunk. If None, a tenth
+            of a second.
+        duration : float
+            The total duration in seconds to read. If None, read until the
+            generator is closed.
+        timeout : float
+            The timeout in seconds for reading a single chunk. Default is 10.
+        decimate : int
+            The factor to decimate by. Default is None, no decimation.
+        
+        yields
+        ------
+        np.ndarray
+            The next chunk of data, with shape (chunk_size,) for one channel
+            and (channels, chunk_size) for multiple channels. The last chunk
+            is shorter if duration is not a whole number of chunks. Decimated
+            chunks have about chunk_size / decimate samples, at
+            getTimeArray(duration, rate)[::decimate].
+        """
+        if decimate is not None:
+            decimator = Decimator(decimate)
+            for chunk in self.stream(channels, rate, chunk_size, duration,
+                                     timeout):
+                yield decimator.update(chunk)
+            
+            if duration is not None:
+                yield decimator.flush()
+            return
+        
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        if chunk_size is None:
+            chunk_size = max(rate // 10, 1)
+        
+        if duration is None:
+            samps = None
+        else:
+            samps = MyDAQ.convertDurationToSamples(rate, duration)
+        
+        channels = MyDAQ._channelKey(channels)
+        shape = MyDAQ._dataShape(channels, chunk_size)
+        self._releaseTasks()
+        
+        with dx.Task() as streamTask:
+            self._addInputChannels(streamTask, list(channels))
+            self._configureChannelTimings(streamTask,
+                                          max(10 * chunk_size, rate),
+                                          rate,
+                                          sample_mode=self.continuous,
+                                          )
+            
+            reader = MyDAQ._makeReader(streamTask, len(channels))
+            chunk = np.empty(shape)
+            
+            streamTask.start()
+            read = 0
+            while samps is None or read < samps:
+                if samps is not None and samps - read < chunk_size:
+                    # Readers need contiguous arrays, so no view for the end
+                    chunk = np.empty(shape[:-1] + (samps - read,))
+                
+                reader.read_many_sample(
+                    chunk,
+                    number_of_samples_per_channel=chunk.shape[-1],
+                    timeout=timeout,
+                )
+                read += chunk.shape[-1]
+                yield chunk
+
+    def read_to_file(self, path: str, duration: float, channels='ai0',
+                     rate=None, chunk_size=None,
+                     timeout: float =10., decimate=None) -> np.memmap:
+        """Read data from the MyDAQ straight into a .npy file.
+        
+        The file is created at the start and memory-mapped, every chunk from
+        stream is written into it and flushed to disk as soon as it is read.
+        Long recordings therefore do not have to fit in memory, and the data
+        read so far survives if the script crashes. The result can be loaded
+        with np.load(path, mmap_mode='r').
+        
+        parameters
+        ----------
+        path : str
+            The .npy file to write to, overwritten if it exists
+        duration : float
+            The duration in seconds to read data for
+        channels : str | list[str]
+            The channel(s) to read from, default is 'ai0'
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        chunk_size : int
+            The number of samples per channel to write at once. If None, a
+            tenth of a second.
+        timeout : float
+            The timeout in seconds for reading a single chunk. Default is 10.
+        decimate : int
+            The factor to decimate by before writing, see read. Default is
+            None, no decimation.
+        
+        returns
+        -------
+        np.memmap
+            The data read from the MyDAQ, shaped like the result of read
+        """
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        samps = MyDAQ.convertDurationToSamples(rate, duration)
+        if decimate is not None:
+            samps = -(-samps // decimate)
+        shape = MyDAQ._dataShape(channels, samps)
+        
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                         shape=shape)
+        
+        start = 0
+        for chunk in self.stream(channels, rate, chunk_size, duration,
+                                 timeout, decimate):
+            data[..., start:start + chunk.shape[-1]] = chunk
+            data.flush()
+            start += chunk.shape[-1]
+        
+        return data
+
+    def measure_decay(self, duration: float, hysteresis: float, rate=None,
+                      channel='ai0', decimate=None, chunk_size=None,
+                      timeout: float =10.) -> tuple:
+        """Measure the peaks of a decaying oscillation while it is read.
+        
+        The signal is streamed, optionally decimated, and every chunk goes
+        through a PeakDetector, so only the peaks are kept. Fit them with
+        fit_decay.
+        
+        parameters
+        ----------
+        duration : float
+            The duration in seconds to read data for
+        hysteresis : float
+            The hysteresis of the PeakDetector in volts
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        channel : str
+            The channel to read from, default is 'ai0'
+        decimate : int
+            The factor to decimate by before finding peaks, see stream.
+            Default is None, no decimation.
+        chunk_size : int
+            The number of samples per chunk, see stream
+        timeout : float
+            The timeout in seconds for reading a single chunk. Default is 10.
+        
+        returns
+        -------
+        np.ndarray
+            The times of the peaks in seconds
+        np.ndarray
+            The values of the signal at the peaks
+        """
+        if rate is None:
+            rate = self.samplerate
+            assert rate is not None, "Samplerate should be set first."
+        
+        detector = PeakDetector(hysteresis, rate / (decimate or 1))
+        for chunk in self.stream(channel, rate, chunk_size, duration,
+                                 timeout, decimate):
+            detector.update(chunk)
+        
+        return detector.times, detector.amplitudes
+
+    def write(self, write_data, rate=None, samps=None, channel='ao0') -> None:
+        """Writes data to the MyDAQ.
+        
+        parameters
+        ----------
+        write_data : array
+            The voltage data to write to the MyDAQ, with shape (samples,) for
+            one channel and (channels, samples) otherwise
+        rate : int
+            The sample rate in Hz, if None take from class attribute
+        samps : int
+            The number of samples to write. If None, all of write_data
+            is written. If not None, the length of write_data is written and 
+            repeated for the ammount of samples requested.
+        channel : str | list[str]
+            The channel(s) to write to
+        """
+        self._releaseTasks()
+        
+        with dx.Task() as writeTask:
+            if rate is None:
+                rate = self.samplerate
+                assert rate is not None, "Samplerate should be set first."
+            
+            if samps is None:
+                samps = np.shape(write_data)[-1]
+            
+            self._addOutputChannels(writeTask, channel)
+            self._configureChannelTimings(writeTask, samps, rate)
+            
+            self._writeFrom(writeTask, write_data, channel)
+            writeTask.start()
+            writeTask.wait_until_done(
+                timeout=MyDAQ.convertSamplesToDuration(rate, samps) + 10
+            )
+            writeTask.stop()
+
+    async def write_async(self, write_data, rate=None, samps=None,
+                          channel='ao0') -> None:
+        """Writes data to the MyDAQ without blocking the event loop.
+        
+        Works like write, but waits for the generation with a task done
+        event. See write for the parameters.
+        """
+        self._releaseTasks()
+        
+        with dx.Task() as writeTask:
+            if rate is None:
+                rate = self.samplerate
+                assert rate is not None, "Samplerate should be set first."
+            
+            if samps is None:
+                samps = np.shape(write_data)[-1]
+            
+            self._addOutputChannels(writeTask, channel)
+            self._configureChannelTimings(writeTask, samps, rate)
+            self._writeFrom(writeTask, write_data, channel)
+            
+            done = MyDAQ._doneFuture(writeTask)
+            try:
+                writeTask.start()
+                await asyncio.wait_for(
+                    done, MyDAQ.convertSamplesToDuration(rate, samps) + 10
+                )
+                
+                # Raises the error of the task if it failed
+                writeTask.wait_until_done(timeout=0)
+            finally:
+                writeTask.stop()
+                writeTask.register_done_event(None)
+    
+    def measure_spectrum(self,
+                         frequencies,
+                         duration: float =1,
+                         amplitude: float =3,
+                         repeat: int =1,
+                         write_channel: str ='ao0',
+                         read_input_channel: str ='ai0',
+                         read_output_channel: str ='ai1',
+                         method: str ='stepped',
+                         settle: float =0,
+                         cycles=None,
+                         min_samples: int =0,
+                         target_snr=None,
+                         adaptive_rate: bool =False,
+                         oversampling: float =20,
+                         alias_margin: float =5,
+                         coherent: bool =False,
+                         return_metadata: bool =False,
+                         checkpoint=None,
+                         resume: bool =False,
+                         raw: bool =False,
+                         out=None,
+                         ):
+        """Measure over a spectrum of frequencies.
+        
+        With method 'stepped' every frequency is measured with its own
+        readWrite call. With method 'sweep' all frequencies of a repeat are
+        joined into one waveform that is written and read in a single
+        acquisition, which removes the dead time between tasks. The record is
+        then cut back into one segment per frequency.
+        
+        By default every frequency is measured for the same duration. When
+        cycles or target_snr is given, every frequency is instead measured
+        only as long as it needs, with duration as the maximum:
+        - cycles: a whole number of periods, at least min_samples long.
+        - target_snr: first measure cycles periods or min_samples samples,
+          then, if the signal to noise ratio of the output (see estimate_snr)
+          is below target_snr, measure again with as many samples as needed
+          to reach it. The number of samples found in the first repeat is
+          used for all repeats. Only for method 'stepped'.
+        
+        With adaptive_rate every frequency is measured at the lowest rate
+        from choose_samplerate that still satisfies oversampling and
+        alias_margin, with the samplerate attribute as the maximum. Low
+        frequencies then need far fewer samples. Only for method 'stepped'.
+        
+        With coherent every frequency is moved to the nearest frequency with
+        a whole number of periods in its record (see snap_frequencies), so the
+        transfer function can be read from a single FFT bin without leakage.
+        The frequencies that were actually measured are returned in the
+        metadata, see return_metadata.
+        
+        With checkpoint, every measured (repeat, frequency) trace is saved to
+        that directory as soon as it is measured (for method 'sweep', after
+        every repeat). With resume, traces already in the directory are
+        loaded instead of measured again, so a sweep that failed halfway can
+        be finished by calling measure_spectrum again with the same settings.
+        Resuming with other (measured) frequencies, raw, samplerate, samples,
+        method or amplitude raises a ValueError. Without resume, traces of an
+        earlier sweep in the directory are removed. The directory also gets the metadata
+        of the sweep, so it can be read back with SweepDataset.
+        
+        parameters
+        ----------
+        frequencies : np.ndarray
+            The frequencies to measure at
+        duration : float
+            The duration of the measurement per frequency, or the maximum
+            duration when cycles or target_snr is given
+        amplitude : float
+            The amplitude of the waveform
+        repeat : int
+            The number of times to measure per frequency
+        write_channel : str
+            The channel to write the waveform to
+        read_input_channel : str
+            The channel to read the original input from (straight from the 
+            output to this channel for later comparison)
+        read_output_channel : str
+            The channel to read the output of the system from
+        method : str
+            'stepped' (default) or 'sweep', see above
+        settle : float
+            Only for method 'sweep'. The time in seconds every frequency is
+            played before the measured segment starts, so the transient of the
+            frequency step is discarded. Default is 0.
+        cycles : int
+            The number of periods to measure per frequency, see above
+        min_samples : int
+            The minimum number of samples per frequency, see above
+        target_snr : float
+            The amplitude signal to noise ratio to reach, see above
+        adaptive_rate : bool
+            Whether to choose the sample rate per frequency, see above
+        oversampling : float
+            The minimum number of samples per period with adaptive_rate
+        alias_margin : float
+            With adaptive_rate, the number of harmonics of every frequency
+            that should stay below the Nyquist frequency
+        coherent : bool
+            Whether to snap the frequencies to whole periods, see above
+        return_metadata : bool
+            Whether to also return the metadata of the measurement
+        checkpoint : str
+            The directory to save every trace to, see above. Default is None,
+            no checkpoints.
+        resume : bool
+            Whether to load traces that are already in checkpoint
+        raw : bool
+            Whether to read raw int16 ADC codes. The result is then a
+            ScaledArray, which converts to volts when indexed and can be
+            saved with save_raw. Not with cycles, target_snr or
+            adaptive_rate. Default is False.
+        out : np.ndarray
+            The array to write the result into, with the shape of the
+            result, for example a memory map from np.lib.format.open_memmap
+            to measure straight to disk. int16 with raw. Not with cycles,
+            target_snr or adaptive_rate. If None, the result is allocated
+            once before the measurement.
+        
+        returns
+        -------
+        np.ndarray
+            The measured data,
+            on the first axis, index 0 is the input data, index 1 is the output
+            data. On the second axis, the index corresponds to repeat. On the
+            third axis, the index corresponds to the frequency as provided.
+            When cycles, target_snr or adaptive_rate is given the number of
+            samples differs per frequency, and the result is an object array
+            without the samples axis that holds every trace as a separate
+            array.
+        dict
+            Only if return_metadata is True. The metadata of the measurement,
+            with the measured frequencies, samplerate and samples per
+            frequency, and the duration, amplitude, repeat, method and
+            channels. Pass metadata['frequencies'] and metadata['samplerate']
+            to get_transfer_functions.
+        """
+        assert isinstance(repeat, int), "Repeat should be an integer."
+        assert repeat > 0, "Repeat should be a positive integer."
+        
+        if method not in ('stepped', 'sweep'):
+            raise ValueError(f"{method} is not a recognized measurement method")
+        
+        adaptive = (cycles is not None or target_snr is not None
+                    or adaptive_rate)
+        if target_snr is not None:
+            assert method == 'stepped', \
+                "Target_snr is only supported by method 'stepped'."
+            assert cycles is not None or min_samples > 0, \
+                "Cycles or min_samples should be given with target_snr."
+        
+        if raw:
+            assert not adaptive, \
+                "Raw is not supported with a different length per frequency."
+        
+        if adaptive_rate:
+            assert method == 'stepped', \
+                "Adaptive_rate is only supported by method 'stepped'."
+            rates = np.asarray([
+                MyDAQ.choose_samplerate(frequency, self.samplerate,
+                                        oversampling, alias_margin)
+                for frequency in frequencies
+            ])
+        else:
+            rates = np.full(len(frequencies), self.samplerate)
+        
+        max_samples = np.asarray([
+            MyDAQ.convertDurationToSamples(rate, duration) for rate in rates
+        ])
+        if cycles is not None or target_snr is not None:
+            samples = np.asarray([
+                MyDAQ._cycleSamples(rate, frequency, min_samples, cycles)
+                for rate, frequency in zip(rates, frequencies)
+            ])
+            samples = np.minimum(samples, max_samples)
+        else:
+            samples = max_samples
+        
+        if coherent:
+            measured = MyDAQ.snap_frequencies(frequencies, rates, samples)
+        else:
+            measured = np.asarray(frequencies, dtype=float)
+        
+        metadata = {
+            'frequencies': measured,
+            'samplerate': rates,
+            'samples': samples,
+            'duration': duration,
+            'amplitude': amplitude,
+            'repeat': repeat,
+            'method': method,
+            'channels': {'write': write_channel,
+                         'input': read_input_channel,
+                         'output': read_output_channel},
+        }
+        
+        # The settings a resumed sweep has to match are saved as well
+        saved = dict(metadata, raw=raw, start_samples=samples.copy(),
+                     start_frequencies=measured.copy())
+        
+        if checkpoint is not None:
+            MyDAQ._startCheckpoint(checkpoint, frequencies, resume, saved)
+            MyDAQ._saveMetadata(checkpoint, saved)
+        
+        # Every trace is written straight into its slot of the result
+        if adaptive:
+            assert out is None, \
+                "Out is not supported with a different length per frequency."
+            data = np.empty((2, repeat, len(frequencies)), dtype=object)
+        else:
+            shape = (2, repeat, len(frequencies), int(samples[0]))
+            if out is None:
+                out = np.empty(shape, dtype=np.int16 if raw else np.float64)
+            if repeat == 1 and out.ndim == 3:
+                out = out[:, None]
+            assert out.shape == shape, \
+                f"Out should have shape {shape}, or without repeat axis for " \
+                "repeat 1."
+            assert out.dtype == (np.int16 if raw else np.float64), \
+                "Out should be int16 with raw and float64 otherwise."
+            data = out
+        
+        read_channel = [read_input_channel, read_output_channel]
+        scaling_path = checkpoint and os.path.join(checkpoint, 'scaling.npy')
+        scaling_saved = False
+        
+        for i in range(repeat):
+            paths = [MyDAQ._checkpointFile(checkpoint, i, j)
+                     for j in range(len(frequencies))]
+            
+            if method == 'sweep':
+                reads = [MyDAQ._loadCheckpoint(path) if resume else None
+                         for path in paths]
+                
+                if any(read is None for read in reads):
+                    reads = self._measure_sweep(measured,
+                                                samples,
+                                                amplitude,
+                                                settle,
+                                                write_channel,
+                                                read_channel,
+                                                raw,
+                                                )
+                    if raw and not scaling_saved:
+                        MyDAQ._saveCheckpoint(scaling_path, self.raw_scaling)
+                        scaling_saved = True
+                    for path, read in zip(paths, reads):
+                        MyDAQ._saveCheckpoint(path, read)
+                
+                for j, read in enumerate(reads):
+                    data[0, i, j] = read[0]
+                    data[1, i, j] = read[1]
+                continue
+            
+            for j in range(len(frequencies)):
+                read = MyDAQ._loadCheckpoint(paths[j]) if resume else None
+                if read is not None:
+                    if i == 0 and target_snr is not None:
+                        # Continue with the length found before the failure
+                        samples[j] = read.shape[-1]
+                        if coherent:
+                            measured[j] = MyDAQ.snap_frequencies(
+                                frequencies[j], rates[j], samples[j]
+                            )
+                        MyDAQ._saveMetadata(checkpoint, saved)
+                    data[0, i, j] = read[0]
+                    data[1, i, j] = read[1]
+                    continue
+                
+                read = self._measure_frequency(measured[j],
+                                               samples[j],
+                                               amplitude,
+                                               write_channel,
+                                               read_channel,
+                                               rates[j],
+                                               out=(None if adaptive
+                                                    else data[:, i, j]),
+                                               raw=raw,
+                                               )
+                
+                # Saved right away, so the traces of a failed sweep can be
+                # opened as well
+                if raw and not scaling_saved:
+                    MyDAQ._saveCheckpoint(scaling_path, self.raw_scaling)
+                    scaling_saved = True
+                
+                if target_snr is not None and i == 0:
+                    snr = MyDAQ.estimate_snr(read[1], measured[j], rates[j])
+                    
+                    if snr < target_snr:
+                        # The amplitude SNR grows with the square root of N
+                        needed = samples[j] * (target_snr / snr)**2
+                        samples[j] = min(MyDAQ._cycleSamples(rates[j],
+                                                             frequencies[j],
+                                                             needed,
+                                                             cycles),
+                                         max_samples[j])
+                        if coherent:
+                            measured[j] = MyDAQ.snap_frequencies(
+                                frequencies[j], rates[j], samples[j]
+                            )
+                        # Keep the saved samples and frequencies in step
+                        MyDAQ._saveMetadata(checkpoint, saved)
+                        read = self._measure_frequency(measured[j],
+                                                       samples[j],
+                                                       amplitude,
+                                                       write_channel,
+                                                       read_channel,
+                                                       rates[j],
+                                                       )
+                
+                MyDAQ._saveCheckpoint(paths[j], read)
+                if adaptive:
+                    data[0, i, j] = read[0]
+                    data[1, i, j] = read[1]
+        
+        if repeat == 1:
+            data = data[:, 0]
+        
+        if raw:
+            # A fully resumed sweep reads nothing, its scaling was saved
+            if scaling_saved:
+                scaling = self.raw_scaling
+            else:
+                scaling = MyDAQ._loadCheckpoint(scaling_path)
+            data = ScaledArray(data, scaling)
+        
+        if not return_metadata:
+            return data
+        return data, metadata
+
+    @staticmethod
+    def _startCheckpoint(checkpoint: str, frequencies, resume: bool,
+                         metadata: dict) -> None:
+        """Prepare a checkpoint directory for a sweep over frequencies.
+        
+        Without resume the traces of an earlier sweep in the directory are
+        removed, so they can never be resumed as part of this sweep.
+        
+        raises
+        ------
+        ValueError
+            If resume is True and the directory holds a sweep over other
+            frequencies, or with another raw, samplerate, start_samples,
+            start_frequencies (the measured frequencies before any SNR
+            extension), method or amplitude in its metadata.json.
+        """
+        os.makedirs(checkpoint, exist_ok=True)
+        path = os.path.join(checkpoint, 'frequencies.npy')
+        
+        if not resume:
+            for name in os.listdir(checkpoint):
+                if ((name.startswith('repeat_')
+                        and name.endswith(('.npy', '.npz')))
+                        or name == 'scaling.npy'):
+                    os.remove(os.path.join(checkpoint, name))
+        
+        if resume and os.path.exists(path):
+            saved = np.load(path)
+            if (saved.shape != np.shape(frequencies)
+                    or not np.allclose(saved, frequencies)):
+                raise ValueError(f"{checkpoint} holds a sweep over other "
+                                 "frequencies")
+        
+        metadata_path = os.path.join(checkpoint, 'metadata.json')
+        if resume and os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                saved = json.load(file)
+            
+            differ = []
+            for key in ('raw', 'samplerate', 'start_samples',
+                        'start_frequencies', 'method', 'amplitude'):
+                if key not in saved:
+                    continue
+                if isinstance(saved[key], (str, bool)):
+                    same = saved[key] == metadata[key]
+                else:
+                    same = (np.shape(saved[key]) == np.shape(metadata[key])
+                            and np.allclose(saved[key], metadata[key]))
+                if not same:
+                    differ.append(key)
+            
+            if differ:
+                raise ValueError(f"{checkpoint} holds a sweep with other "
+                                 f"{', '.join(differ)}")
+        
+        np.save(path, frequencies)
+
+    @staticmethod
+    def _saveMetadata(checkpoint: str, metadata: dict) -> None:
+        """Save the metadata of a sweep as json, for SweepDataset.
+        
+        Does nothing without checkpoint, so it can be called whenever the
+        samples or frequencies of the sweep change.
+        """
+        if checkpoint is None:
+            return
+        
+        metadata = {key: value.tolist() if isinstance(value, np.ndarray)
+                    else value for key, value in metadata.items()}
+        
+        path = os.path.join(checkpoint, 'metadata.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(metadata, file, indent=4)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _checkpointFile(checkpoint, repeat: int, frequency: int):
+        """The file of one (repeat, frequency) trace, None without checkpoint."""
+        if checkpoint is None:
+            return None
+        return os.path.join(checkpoint,
+                            f'repeat_{repeat}_frequency_{frequency}.npy')
+
+    @staticmethod
+    def _loadCheckpoint(path):
+        """Load a saved trace, None if it was not saved."""
+        if path is None:
+            return None
+        if os.path.exists(path):
+            return np.load(path)
+        
+        # Traces compressed by SweepDataset.compress
+        path = path.replace('.npy', '.npz')
+        if os.path.exists(path):
+            with np.load(path) as file:
+                return file['trace']
+        return None
+
+    @staticmethod
+    def _saveCheckpoint(path, read: np.ndarray) -> None:
+        """Save a trace, through a temporary file so it is never half written."""
+        if path is None:
+            return
+        
+        temporary = path.replace('.npy', '.tmp.npy')
+        np.save(temporary, read)
+        os.replace(temporary, path)
+
+    def _measure_frequency(self,
+                           frequency: float,
+                           samples: int,
+                           amplitude: float,
+                           write_channel,
+                           read_channel,
+                           rate=None,
+                           out=None,
+                           raw: bool =False,
+                           ) -> np.ndarray:
+        """Measure a sine of a number of samples with readWrite.
+        
+        The rate defaults to the samplerate attribute, out and raw are passed
+        on to readWrite.
+        
+        returns
+        -------
+        np.ndarray
+            The measured data, with shape (channels, samples)
+        """
+        if rate is None:
+            rate = self.samplerate
+        
+        # Same time steps as getTimeArray
+        timeArray = np.arange(1, samples + 1) / rate
+        waveform = MyDAQ.findFunction('sine')(timeArray, amplitude,
+                                              frequency, 0)
+        
+        return self.readWrite(waveform,
+                              rate=rate,
+                              read_channel=read_channel,
+                              write_channel=write_channel,
+                              out=out,
+                              raw=raw,
+                              )
+
+    @staticmethod
+    def choose_samplerate(frequency: float,
+                          max_rate: int,
+                          oversampling: float =20,
+                          alias_margin: float =5,
+                          ) -> int:
+        """Choose the lowest suitable samplerate for a frequency.
+        
+        The MyDAQ derives its sample clock by dividing a timebase, so only
+        rates max_rate / k with integer k are used. Of those that are a whole
+        number of Hz, the lowest rate is taken with at least oversampling
+        samples per period and alias_margin harmonics below the Nyquist
+        frequency.
+        
+        parameters
+        ----------
+        frequency : float
+            The frequency to measure
+        max_rate : int
+            The highest allowed samplerate
+        oversampling : float
+            The minimum number of samples per period
+        alias_margin : float
+            The number of harmonics that should stay below half the samplerate
+        
+        returns
+        -------
+        int
+            The samplerate, max_rate if no lower rate is suitable
+        """
+        needed = frequency * max(oversampling, 2 * alias_margin)
+        if needed >= max_rate:
+            return max_rate
+        
+        # The largest divisor k of max_rate with max_rate / k >= needed
+        for k in range(int(max_rate // needed), 0, -1):
+            if max_rate % k == 0:
+                return max_rate // k
+
+    @staticmethod
+    def _cycleSamples(samplerate: int, frequency: float, min_samples,
+                      cycles=None) -> int:
+        """The number of samples for a whole number of periods.
+        
+        parameters
+        ----------
+        samplerate : int
+            The samplerate of the measurement
+        frequency : float
+            The frequency of the waveform
+        min_samples : int
+            The minimum number of samples
+        cycles : int
+            The minimum number of periods. If None, min_samples is returned
+            without rounding to whole periods.
+        
+        returns
+        -------
+        int
+            The number of samples
+        """
+        if cycles is None:
+            return int(np.ceil(min_samples))
+        
+        periods = max(cycles, np.ceil(min_samples * frequency / samplerate))
+        return int(round(periods * samplerate / frequency))
+
+    @staticmethod
+    def estimate_snr(trace, frequency: float, samplerate: int) -> float:
+        """Estimate the amplitude signal to noise ratio of a sine in a trace.
+        
+        The signal is the FFT bin nearest to frequency, the noise is the
+        median of the other bins, leaving out DC and two bins on either side
+        of the signal.
+        
+        parameters
+        ----------
+        trace : np.ndarray
+            The measured data
+        frequency : float
+            The frequency of the sine
+        samplerate : int
+            The samplerate of the measurement
+        
+        returns
+        -------
+        float
+            The ratio of the signal amplitude to the noise amplitude per bin
+        """
+        power = np.abs(np.fft.rfft(trace))**2
+        freq = np.fft.rfftfreq(len(trace), 1/samplerate)
+        idx = MyDAQ.find_nearest_idx(freq, frequency)
+        
+        noise = np.ones(len(power), dtype=bool)
+        noise[0] = False
+        noise[max(idx - 2, 0):idx + 3] = False
+        
+        return np.sqrt(power[idx] / np.median(power[noise]))
+
+    @staticmethod
+    def measure_spectrum_parallel(daqs,
+                                  frequencies,
+                                  duration: float =1,
+                                  amplitude: float =3,
+                                  repeat: int =1,
+                                  write_channel: str ='ao0',
+                                  read_input_channel: str ='ai0',
+                                  read_output_channel: str ='ai1',
+                                  ) -> np.ndarray:
+        """Measure over a spectrum of frequencies with multiple MyDAQs.
+        
+        The (repeat, frequency) measurements are divided over the MyDAQs,
+        which should be wired to identical circuits. Every MyDAQ gets its own
+        thread and takes the next measurement as soon as it is done, so the
+        sweep takes about 1/len(daqs) of the time of measure_spectrum.
+        
+        parameters
+        ----------
+        daqs : list[MyDAQ]
+            The MyDAQs to measure with, all with the same samplerate
+        frequencies : np.ndarray
+            The frequencies to measure at
+        duration : float
+            The duration of the measurement per frequency
+        amplitude : float
+            The amplitude of the waveform
+        repeat : int
+            The number of times to measure per frequency
+        write_channel : str
+            The channel to write the waveform to, on every MyDAQ
+        read_input_channel : str
+            The channel to read the original input from, on every MyDAQ
+        read_output_channel : str
+            The channel to read the output of the system from, on every MyDAQ
+        
+        returns
+        -------
+        np.ndarray
+            The measured data, like provided by measure_spectrum
+        """
+        assert isinstance(repeat, int), "Repeat should be an integer."
+        assert repeat > 0, "Repeat should be a positive integer."
+        
+        samplerate = daqs[0].samplerate
+        assert all(daq.samplerate == samplerate for daq in daqs), \
+            "All MyDAQs should have the same samplerate."
+        
+        samples = MyDAQ.convertDurationToSamples(samplerate, duration)
+        data = np.empty((2, repeat, len(frequencies), samples))
+        
+        jobs = queue.SimpleQueue()
+        for i in range(repeat):
+            for j in range(len(frequencies)):
+                jobs.put((i, j))
+        
+        def worker(daq: MyDAQ) -> None:
+            while True:
+                try:
+                    i, j = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                
+                waveform = daq.generateWaveform('sine',
+                                                samplerate,
+                                                frequencies[j],
+                                                amplitude,
+                                                duration=duration
+                                                )[1]
+                daq.readWrite(waveform,
+                              read_channel=[read_input_channel,
+                                            read_output_channel],
+                              write_channel=write_channel,
+                              out=data[:, i, j],
+                              )
+        
+        with ThreadPoolExecutor(max_workers=len(daqs)) as pool:
+            workers = [pool.submit(worker, daq) for daq in daqs]
+            for future in workers:
+                future.result()
+        
+        if repeat == 1:
+            return data[:, 0]
+        else:
+            return data
+
+    def _measure_sweep(self,
+                       frequencies,
+                       samples,
+                       amplitude: float,
+                       settle: float,
+                       write_channel,
+                       read_channel,
+                       raw: bool =False,
+                       ) -> list:
+        """Measure all frequencies in one continuous acquisition.
+        
+        parameters
+        ----------
+        frequencies : np.ndarray
+            The frequencies to measure at
+        samples : np.ndarray
+            The number of samples of the measured segment per frequency
+        amplitude : float
+            The amplitude of the waveform
+        settle : float
+            The time per frequency that is played but not returned
+        write_channel : str
+            The channel to write the waveform to
+        read_channel : list[str]
+            The channels to read from
+        raw : bool
+            Whether to read raw ADC codes, see readWrite
+        
+        returns
+        -------
+        list[np.ndarray]
+            The measured segment of every frequency, with shape
+            (channels, samples)
+        """
+        settle_samples = MyDAQ.convertDurationToSamples(self.samplerate, settle)
+        segments = settle_samples + np.asarray(samples)
+        
+        sine = MyDAQ.findFunction('sine')
+        waveform = np.concatenate([
+            # Same time steps as getTimeArray, for every segment
+            sine(np.arange(1, segment + 1) / self.samplerate,
+                 amplitude, frequency, 0)
+            for frequency, segment in zip(frequencies, segments)
+        ])
+        
+        read = self.readWrite(waveform,
+                              read_channel=read_channel,
+                              write_channel=write_channel,
+                              raw=raw,
+                              )
+        
+        starts = np.cumsum(segments) - segments
+        return [read[:, start + settle_samples:start + segment]
+                for start, segment in zip(starts, segments)]
+
+    def _measure_transfer(self,
+                          frequencies,
+                          duration: float,
+                          amplitude: float,
+                          repeat: int,
+                          write_channel: str,
+                          read_input_channel: str,
+                          read_output_channel: str,
+                          **kwargs,
+                          ):
+        """Measure frequencies with measure_spectrum and analyse them.
+        
+        The transfer function is estimated with the lock-in method at the
+        frequencies that were actually measured.
+        
+        returns
+        -------
+        frequencies : np.ndarray
+            The measured frequencies
+        transfer_functions : np.ndarray
+            The transfer functions, with shape (repeat, frequencies)
+        """
+        data, metadata = self.measure_spectrum(
+            frequencies, duration, amplitude, repeat, write_channel,
+            read_input_channel, read_output_channel,
+            return_metadata=True, **kwargs,
+        )
+        transfer = MyDAQ.get_transfer_functions(
+            data, metadata['frequencies'], repeat=repeat,
+            samplerate=metadata['samplerate'], method='lockin',
+        )
+        return metadata['frequencies'], transfer.reshape(repeat, -1)
+
+    def measure_transfer_pipelined(self,
+                                   frequencies,
+                                   duration: float =1,
+                                   amplitude: float =3,
+                                   repeat: int =1,
+                                   write_channel: str ='ao0',
+                                   read_input_channel: str ='ai0',
+                                   read_output_channel: str ='ai1',
+                                   integration_range: int =0,
+                                   method: str ='fft',
+                                   keep_raw: bool =False,
+                                   ):
+        """Measure a spectrum and analyse it while it is being measured.
+        
+        Every trace is handed to a worker thread as soon as it is read, which
+        computes its transfer function with get_transfer_functions while the
+        next frequency is measured. The transfer functions are therefore
+        ready when the last measurement ends. Without keep_raw the traces are
+        read into two alternating buffers and dropped after analysis, so
+        memory use does not grow with the number of frequencies.
+        
+        parameters
+        ----------
+        frequencies : np.ndarray
+            The frequencies to measure at
+        duration : float
+            The duration of the measurement per frequency
+        amplitude : float
+            The amplitude of the waveform
+        repeat : int
+            The number of times to measure per frequency
+        write_channel : str
+            The channel to write the waveform to
+        read_input_channel : str
+            The channel to read the original input from
+        read_output_channel : str
+            The channel to read the output of the system from
+        integration_range : int
+            See get_transfer_functions
+        method : str
+            See get_transfer_functions
+        keep_raw : bool
+            Whether to also return the measured data
+        
+        returns
+        -------
+        transfer_functions : np.ndarray
+            The transfer function(s), like provided by get_transfer_functions
+        data : np.ndarray
+            Only if keep_raw is True. The measured data, like provided by
+            measure_spectrum
+        """
+        assert isinstance(repeat, int), "Repeat should be an integer."
+        assert repeat > 0, "Repeat should be a positive integer."
+        
+        samples = MyDAQ.convertDurationToSamples(self.samplerate, duration)
+        read_channel = [read_input_channel, read_output_channel]
+        
+        if keep_raw:
+            data = np.empty((2, repeat, len(frequencies), samples))
+        else:
+            buffers = [np.empty((2, samples)) for _ in range(2)]
+        
+        def analyse(read, frequency):
+            return MyDAQ.get_transfer_functions(
+                read[:, np.newaxis, np.newaxis], [frequency],
+                samplerate=self.samplerate,
+                integration_range=integration_range, method=method,
+            )[0]
+        
+        jobs = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            for i in range(repeat):
+                for j, frequency in enumerate(frequencies):
+                    if keep_raw:
+                        out = data[:, i, j]
+                    else:
+                        # Wait until the buffer is analysed before reusing it
+                        if len(jobs) >= 2:
+                            jobs[-2].result()
+                        out = buffers[len(jobs) % 2]
+                    
+                    read = self._measure_frequency(frequency,
+                                                   samples,
+                                                   amplitude,
+                                                   write_channel,
+                                                   read_channel,
+                                                   out=out,
+                                                   )
+                    jobs.append(pool.submit(analyse, read, frequency))
+        
+        transfer = np.asarray([job.result() for job in jobs])
+        transfer = transfer.reshape(repeat, len(frequencies))
+        
+        if repeat == 1:
+            transfer = transfer[0]
+        
+        if not keep_raw:
+            return transfer
+        return transfer, (data[:, 0] if repeat == 1 else data)
+
+    def measure_adaptive(self,
+                         f_min: float,
+                         f_max: float,
+                         resolution: float,
+                         initial: int =10,
+                         max_points: int =50,
+                         per_round: int =3,
+                         tolerance: float =0.05,
+                         log: bool =True,
+                         duration: float =1,
+                         amplitude: float =3,
+                         repeat: int =1,
+                         write_channel: str ='ao0',
+                         read_input_channel: str ='ai0',
+                         read_output_channel: str ='ai1',
+                         **kwargs,
+                         ):
+        """Measure a transfer function with frequencies placed where needed.
+        
+        Starts with a coarse grid of initial frequencies. Every round, the
+        change of the transfer function between neighbouring frequencies is
+        estimated as |H2 - H1| / max(|H1|, |H2|), which is large where the
+        gain or the phase changes fast, like around a resonance. The
+        per_round intervals with the largest change get a new frequency in
+        their middle. This continues until no interval wider than resolution
+        changes more than tolerance, or max_points frequencies are measured.
+        
+        With coherent (passed on to measure_spectrum) a new frequency can be
+        snapped onto a frequency that was already measured. It is then
+        dropped and its interval is not split again, the search stops once a
+        round adds no new frequency.
+        
         parameters
         ----------
-        write_data : array
-            The voltage data to write to the MyDAQ
-        rate : int
-            The sample rate in Hz, if None take from class attribute
-        samps : int
-            The number of samples to read and write. If None, all of write_data
-            is written, and the length of write_data is read. If not None, the 
-            length of write_data is written and repeated for the ammount of
-            samples requested.
-        read_channel : str
-            The channel to read from, default is 'ai0'
+        f_min : float
+            The lowest frequency
+        f_max : float
+            The highest frequency
+        resolution : float
+            The smallest interval in Hz that is still split
+        initial : int
+            The number of frequencies of the coarse grid
+        max_points : int
+            The maximum number of frequencies to measure
+        per_round : int
+            The maximum number of frequencies added per round
+        tolerance : float
+            The relative change below which an interval is not split
+        log : bool
+            Whether to space the frequencies logarithmically
+        duration : float
+            The duration of the measurement per frequency
+        amplitude : float
+            The amplitude of the waveform
+        repeat : int
+            The number of times to measure per frequency
         write_channel : str
-            The channel to write to, default is 'ao0'
-
+            The channel to write the waveform to
+        read_input_channel : str
+            The channel to read the original input from
+        read_output_channel : str
+            The channel to read the output of the system from
+        **kwargs
+            Additional keyword arguments for measure_spectrum
+        
         returns
         -------
-        np.ndarray
-            The data read from the MyDAQ
+        frequencies : np.ndarray
+            The measured frequencies, sorted
+        transfer_functions : np.ndarray
+            The transfer function(s) at those frequencies, like provided by
+            get_transfer_functions
         """
-        with dx.Task('AOTask') as writeTask, dx.Task('AITask') as readTask:
-            if rate is None:
-                rate = self.samplerate
-                assert rate is not None, "Samplerate should be set first."
+        assert isinstance(repeat, int), "Repeat should be an integer."
+        assert repeat > 0, "Repeat should be a positive integer."
+        assert initial >= 2, "Initial should be at least 2."
+        
+        channels = (write_channel, read_input_channel, read_output_channel)
+        
+        if log:
+            batch = np.logspace(np.log10(f_min), np.log10(f_max), initial)
+        else:
+            batch = np.linspace(f_min, f_max, initial)
+        frequencies, transfer = self._measure_transfer(batch, duration,
+                                                       amplitude, repeat,
+                                                       *channels, **kwargs)
+        
+        # Intervals whose middle was snapped onto a measured frequency
+        exhausted = set()
+        
+        while len(frequencies) < max_points:
+            order = np.argsort(frequencies)
+            frequencies = frequencies[order]
+            transfer = transfer[:, order]
             
-            if samps is None:
-                samps = len(write_data)
+            mean = np.mean(transfer, axis=0)
+            change = (np.abs(np.diff(mean))
+                      / np.maximum(np.abs(mean[1:]), np.abs(mean[:-1])))
+            change[np.diff(frequencies) <= resolution] = 0
+            for i in range(len(change)):
+                if (frequencies[i], frequencies[i + 1]) in exhausted:
+                    change[i] = 0
             
-            self._addOutputChannels(writeTask, write_channel)
-            self._addInputChannels(readTask, read_channel)
+            split = np.argsort(change)[::-1][:per_round]
+            split = split[change[split] > tolerance]
+            split = split[:max_points - len(frequencies)]
+            if len(split) == 0:
+                break
             
-            # readTask.ai_channels.add_ai_voltage_chan(f'{self.name}/{read_channel}')
-            # writeTask.ao_channels.add_ao_voltage_chan(f'{self.name}/{write_channel}')
-
-            self._configureChannelTimings(readTask, samps)
-            self._configureChannelTimings(writeTask, samps)
-            # readTask.timing.cfg_samp_clk_timing(rate, sample_mode=self.finite,
-            #                                     samps_per_chan=samps)
-            # writeTask.timing.cfg_samp_clk_timing(rate, sample_mode=self.finite,
-            #                                     samps_per_chan=samps)
-
-            writeTask.write(write_data, auto_start=True)
-            read_data = readTask.read(number_of_samples_per_channel = samps)
+            lower = frequencies[split]
+            upper = frequencies[split + 1]
+            batch = np.sqrt(lower * upper) if log else (lower + upper) / 2
             
-            writeTask.stop()
-            return np.asarray(read_data)
+            new_frequencies, new_transfer = self._measure_transfer(
+                batch, duration, amplitude, repeat, *channels, **kwargs
+            )
+            
+            # Drop frequencies that were measured before or in this round
+            new = np.ones(len(new_frequencies), dtype=bool)
+            for i, frequency in enumerate(new_frequencies):
+                earlier = new_frequencies[:i][new[:i]]
+                known = np.concatenate((frequencies, earlier))
+                if np.any(np.isclose(known, frequency, rtol=1e-9, atol=0)):
+                    new[i] = False
+                    exhausted.add((lower[i], upper[i]))
+            
+            if not np.any(new):
+                break
+            
+            frequencies = np.concatenate((frequencies, new_frequencies[new]))
+            transfer = np.concatenate((transfer, new_transfer[:, new]), axis=1)
+        
+        order = np.argsort(frequencies)
+        if repeat == 1:
+            return frequencies[order], transfer[0, order]
+        else:
+            return frequencies[order], transfer[:, order]
 
-    def read(self, duration: float, rate=None, channel='ai0',
-             timeout:float =300.) -> np.ndarray:
-        """Reads data from the MyDAQ.
+    def measure_converged(self,
+                          frequencies,
+                          gain_error: float =0.1,
+                          phase_error: float =0.01,
+                          min_repeat: int =3,
+                          max_repeat: int =10,
+                          duration: float =1,
+                          amplitude: float =3,
+                          write_channel: str ='ao0',
+                          read_input_channel: str ='ai0',
+                          read_output_channel: str ='ai1',
+                          **kwargs,
+                          ):
+        """Repeat a spectrum measurement only where it has not converged.
+        
+        Every frequency is measured min_repeat times. After that, only the
+        frequencies where the standard error of the mean gain or phase is
+        still above gain_error or phase_error are measured again, until they
+        converge or are measured max_repeat times.
         
         parameters
         ----------
-        rate : int
-            The sample rate in Hz, if None take from class attribute
+        frequencies : np.ndarray
+            The frequencies to measure at
+        gain_error : float
+            The target standard error of the gain in dB
+        phase_error : float
+            The target standard error of the phase in radians
+        min_repeat : int
+            The number of times every frequency is measured, at least 2
+        max_repeat : int
+            The maximum number of times a frequency is measured
         duration : float
-            The duration in seconds to read data for
-        channel : str
-            The channel to read from, default is 'ai0'
-        timeout : float
-            The timeout in seconds for the read operation. Default is 300.
+            The duration of the measurement per frequency
+        amplitude : float
+            The amplitude of the waveform
+        write_channel : str
+            The channel to write the waveform to
+        read_input_channel : str
+            The channel to read the original input from
+        read_output_channel : str
+            The channel to read the output of the system from
+        **kwargs
+            Additional keyword arguments for measure_spectrum
         
         returns
         -------
-        np.ndarray
-            The data read from the MyDAQ
+        transfer_functions : np.ma.MaskedArray
+            The transfer functions, with shape (max_repeat, frequencies).
+            Repeats that were not measured are masked, so analyse_transfer
+            averages every frequency over its own measurements.
+        counts : np.ndarray
+            The number of measurements per frequency
         """
-        if rate is None:
-                rate = self.samplerate
-                assert rate is not None, "Samplerate should be set first."
+        assert min_repeat >= 2, "Min_repeat should be at least 2."
+        assert max_repeat >= min_repeat, \
+            "Max_repeat should be at least min_repeat."
         
-        samps = MyDAQ.convertDurationToSamples(rate, duration)
-
-        with dx.Task('readTask') as readTask:
-            self._addInputChannels(readTask, channel)
-            self._configureChannelTimings(readTask, samps)
-
-            read_data = readTask.read(number_of_samples_per_channel = samps,
-                                      timeout=timeout)
-            return np.asarray(read_data)
-
-    def write(self, write_data, rate=None, samps=None, channel='ao0') -> None:
-        """Writes data to the MyDAQ.
+        frequencies = np.asarray(frequencies)
+        transfer = np.ma.masked_all((max_repeat, len(frequencies)),
+                                    dtype=complex)
+        counts = np.zeros(len(frequencies), dtype=int)
+        active = np.arange(len(frequencies))
         
-        parameters
-        ----------
-        write_data : array
-            The voltage data to write to the MyDAQ
-        rate : int
-            The sample rate in Hz, if None take from class attribute
-        samps : int
-            The number of samples to write. If None, all of write_data
-            is written. If not None, the length of write_data is written and 
-            repeated for the ammount of samples requested.
-        channel : str
-            The channel to write to
-        """
-        with dx.Task('writeTask') as writeTask:
-            if rate is None:
-                rate = self.samplerate
-                assert rate is not None, "Samplerate should be set first."
+        for i in range(max_repeat):
+            new_transfer = self._measure_transfer(frequencies[active],
+                                                  duration,
+                                                  amplitude,
+                                                  1,
+                                                  write_channel,
+                                                  read_input_channel,
+                                                  read_output_channel,
+                                                  **kwargs,
+                                                  )[1]
+            transfer[i, active] = new_transfer[0]
+            counts[active] += 1
             
-            if samps is None:
-                samps = len(write_data)
+            if i + 1 < min_repeat:
+                continue
             
-            self._addOutputChannels(writeTask, channel)
-            self._configureChannelTimings(writeTask, samps)
+            measured = transfer[:i + 1, active]
+            gain = 20 * np.log10(np.abs(measured))
+            phase = np.angle(measured)
             
-            writeTask.write(write_data, auto_start=True)
-            sleep(samps/rate + 0.001)
-            writeTask.stop()
-    
-    def measure_spectrum(self,
-                         frequencies,
-                         duration: float =1,
-                         amplitude: float =3,
-                         repeat: int =1,
-                         write_channel: str ='ao0',
-                         read_input_channel: str ='ai0',
-                         read_output_channel: str ='ai1',
-                         ):
-        """Measure over a spectrum of frequencies.
+            gain_se = np.std(gain, axis=0, ddof=1) / np.sqrt(i + 1)
+            phase_se = np.std(phase, axis=0, ddof=1) / np.sqrt(i + 1)
+            
+            active = active[(gain_se > gain_error) | (phase_se > phase_error)]
+            if len(active) == 0:
+                break
+        
+        return transfer, counts
+
+    def measure_multisine(self,
+                          frequencies,
+                          duration: float =1,
+                          amplitude: float =3,
+                          repeat: int =1,
+                          write_channel: str ='ao0',
+                          read_input_channel: str ='ai0',
+                          read_output_channel: str ='ai1',
+                          settle: float =0,
+                          return_frequencies: bool =False,
+                          ) -> np.ndarray:
+        """Measure the transfer function at all frequencies at once.
+        
+        A multisine containing all frequencies (see generateMultisine) is
+        played once per repeat, and the transfer function at every frequency
+        is taken from a single FFT of the input and output channels. The
+        frequencies are placed on the nearest FFT bin, so multiples of
+        1/duration Hz.
         
         parameters
         ----------
         frequencies : np.ndarray
             The frequencies to measure at
         duration : float
-            The duration of the measurement per frequency
+            The duration of the measured multisine
         amplitude : float
-            The amplitude of the waveform
+            The peak amplitude of the multisine
         repeat : int
-            The number of times to measure per frequency
+            The number of times to measure
         write_channel : str
             The channel to write the waveform to
         read_input_channel : str
@@ -280,51 +2686,59 @@ class MyDAQ():
             output to this channel for later comparison)
         read_output_channel : str
             The channel to read the output of the system from
+        settle : float
+            The time in seconds the multisine is played before the measured
+            part starts, so the transient of the system is discarded. Default
+            is 0.
+        return_frequencies : bool
+            Whether to also return the frequencies that were measured
         
         returns
         -------
         np.ndarray
-            The measured data,
-            on the first axis, index 0 is the input data, index 1 is the output
-            data. On the second axis, the index corresponds to repeat. On the
-            third axis, the index corresponds to the frequency as provided.
+            The transfer function(s) of the system, like provided by
+            get_transfer_functions
+        np.ndarray
+            Only if return_frequencies is True. The frequencies of the FFT
+            bins that were measured, to plot and fit against.
         """
         assert isinstance(repeat, int), "Repeat should be an integer."
         assert repeat > 0, "Repeat should be a positive integer."
         
-        input_data = []
-        output_data = []
+        waveform, bins = MyDAQ.generateMultisine(self.samplerate,
+                                                 frequencies,
+                                                 amplitude,
+                                                 duration,
+                                                 )[1:]
+        
+        # The multisine is periodic, so its tail leads into the measured part
+        settle_samples = MyDAQ.convertDurationToSamples(self.samplerate, settle)
+        if settle_samples > 0:
+            waveform = np.concatenate((np.resize(waveform[::-1],
+                                                 settle_samples)[::-1],
+                                       waveform))
         
+        full_transfer = []
         for _ in range(repeat):
-            input_data_i = []
-            output_data_i = []
-            
-            for frequency in frequencies:
-                waveform = self.generateWaveform('sine',
-                                                 self.samplerate,
-                                                 frequency,
-                                                 amplitude,
-                                                 duration=duration
-                                                 )[1]
-                
-                read = self.readWrite(waveform,
-                                      read_channel=[read_input_channel,
-                                                    read_output_channel],
-                                      write_channel=write_channel
-                                      )
-                
-                input_data_i.append(read[0])
-                output_data_i.append(read[1])
+            read = self.readWrite(waveform,
+                                  read_channel=[read_input_channel,
+                                                read_output_channel],
+                                  write_channel=write_channel,
+                                  )
             
-            input_data.append(np.asarray(input_data_i))
-            output_data.append(np.asarray(output_data_i))
+            fourier = np.fft.rfft(read[:, settle_samples:], axis=-1)
+            full_transfer.append(fourier[1, bins] / fourier[0, bins])
         
         if repeat == 1:
-            return np.stack((np.asarray(input_data_i),
-                             np.asarray(output_data_i)))
+            full_transfer = full_transfer[0]
         else:
-            return np.stack((np.asarray(input_data),
-                             np.asarray(output_data)))
+            full_transfer = np.asarray(full_transfer)
+        
+        if not return_frequencies:
+            return full_transfer
+        
+        samples = MyDAQ.convertDurationToSamples(self.samplerate, duration)
+        return full_transfer, bins * self.samplerate / samples
 
     @staticmethod
     def get_transfer_functions(
@@ -333,22 +2747,34 @@ class MyDAQ():
         repeat: int = 1,
         samplerate: int = 200_000,
         integration_range: int = 0,
+        method: str = 'fft',
         ) -> np.ndarray:
         """Analyse the spectrum of a measured dataset.
         
+        With method 'fft' the transfer function is read from the FFT bin
+        nearest to every frequency, or integrated around it. With method
+        'lockin' every trace is demodulated at exactly the measured frequency
+        with a LockIn, which takes O(N) time and memory per trace and needs no
+        FFT.
+        
         parameters
         ----------
         data : np.ndarray
-            The measured data, like provided by measure_spectrum
+            The measured data, like provided by measure_spectrum. Object
+            arrays with a different number of samples per frequency are
+            analysed one frequency at a time.
         frequencies : np.ndarray
             The frequencies measured at
         repeat : int
             The number of times the measurement was repeated
-        samplerate : int
-            The samplerate of the measurement
+        samplerate : int | np.ndarray
+            The samplerate of the measurement, or of every frequency
         integration_range : int
             How many points to integrate over left and right from the assumed
             peak. [idx-integratin_range:idx+integration_range] is integrated.
+            Only used by method 'fft'.
+        method : str
+            'fft' (default) or 'lockin', see above
         
         returns
         -------
@@ -358,38 +2784,88 @@ class MyDAQ():
         assert isinstance(repeat, int), "Repeat should be an integer."
         assert repeat > 0, "Repeat should be a positive integer."
         
-        full_transfer = []
-        for i in range(repeat):
-            transfer_function = []
+        if method not in ('fft', 'lockin'):
+            raise ValueError(f"{method} is not a recognized analysis method")
+        
+        data = np.asarray(data)
+        if data.dtype == object or np.ndim(samplerate) > 0:
+            if data.ndim == (2 if data.dtype == object else 3):
+                # A single repeat, as returned by measure_spectrum(repeat=1)
+                data = data[:, np.newaxis]
+            
+            rates = np.broadcast_to(samplerate, len(frequencies))
+            transfer = np.empty((repeat, len(frequencies)), dtype=complex)
             for j, frequency in enumerate(frequencies):
-                fourier_in = np.fft.fft(data[0][i][j])
-                fourier_out = np.fft.fft(data[1][i][j])
-                freq = np.fft.fftfreq(len(data[0][i][j]), 1/samplerate)
-                
-                if integration_range == 0:
-                    idx = MyDAQ.find_nearest_idx(freq, frequency)
-                    transfer = fourier_out[idx] / fourier_in[idx]
-                    transfer_function.append(transfer)
-                    continue
-                else:
-                    idx = MyDAQ.find_nearest_idx(freq, frequency)
-                    integrated_in = np.trapz(fourier_in[idx-integration_range:idx+integration_range],
-                                            freq[idx-integration_range:idx+integration_range])
-                    
-                    integrated_out = np.trapz(fourier_out[idx-integration_range:idx+integration_range],
-                                            freq[idx-integration_range:idx+integration_range])
-                
-                transfer = integrated_out / integrated_in
-                
-                transfer_function.append(transfer)
+                traces = np.stack([np.stack(data[k, :repeat, j])
+                                   for k in range(2)])
+                transfer[:, j] = MyDAQ.get_transfer_functions(
+                    traces[:, :, np.newaxis], [frequency], repeat=repeat,
+                    samplerate=rates[j], integration_range=integration_range,
+                    method=method,
+                ).reshape(repeat)
+            
+            if repeat == 1:
+                return transfer[0]
+            else:
+                return transfer
+        
+        if data.ndim == 3:
+            # A single repeat, as returned by measure_spectrum(repeat=1)
+            data = data[:, np.newaxis]
+        data = data[:, :repeat]
+        
+        if method == 'lockin':
+            transfer = np.empty(data.shape[1:3], dtype=complex)
+            for j, frequency in enumerate(frequencies):
+                lockin = LockIn(frequency, samplerate)
+                lockin.update(data[:, :, j])
+                transfer[:, j] = lockin.value[1] / lockin.value[0]
+            
+            if repeat == 1:
+                return transfer[0]
+            else:
+                return transfer
+        
+        # One transform for all channels, repeats and frequencies at once
+        fourier = np.fft.rfft(data, axis=-1)
+        freq = np.fft.rfftfreq(data.shape[-1], 1/samplerate)
+        
+        idx = MyDAQ._nearest_bins(freq, frequencies)
+        rows = np.arange(len(idx))
+        
+        if integration_range == 0:
+            peak = fourier[:, :, rows, idx]
+            transfer = peak[1] / peak[0]
+        else:
+            window = idx[:, np.newaxis] + np.arange(-integration_range,
+                                                    integration_range)
+            # Repeated edge bins have zero width, so this truncates the window
+            window = np.clip(window, 0, len(freq) - 1)
+            values = fourier[:, :, rows[:, np.newaxis], window]
             
-            full_transfer.append(np.asarray(transfer_function))
+            # Trapezoidal integration over the last axis of every window
+            steps = np.diff(freq[window], axis=-1)
+            integrated = np.sum((values[..., 1:] + values[..., :-1])
+                                * steps / 2, axis=-1)
+            transfer = integrated[1] / integrated[0]
         
         if repeat == 1:
-            return np.asarray(transfer_function)
+            return transfer[0]
         else:
-            return np.asarray(full_transfer)
+            return transfer
+
+    @staticmethod
+    def _nearest_bins(freq: np.ndarray, frequencies) -> np.ndarray:
+        """Vectorised find_nearest_idx for every frequency in sorted freq.
         
+        Like find_nearest_idx, a frequency halfway between two bins gives the
+        lower bin.
+        """
+        frequencies = np.asarray(frequencies, dtype=float)
+        idx = np.clip(np.searchsorted(freq, frequencies), 1, len(freq) - 1)
+        lower = (frequencies - freq[idx - 1]) <= (freq[idx] - frequencies)
+        return idx - lower
+
     @staticmethod
     def analyse_transfer(transfer_functions: np.ndarray, isgain=True):
         """Analyse the transfer functions of a system.
@@ -397,7 +2873,9 @@ class MyDAQ():
         parameters
         ----------
         transfer_functions : np.ndarray
-            The transfer functions of the system
+            The transfer functions of the system. Masked arrays, like
+            provided by measure_converged, are averaged over the unmasked
+            repeats only.
         isgain : bool
             Whether to analyse the gain or the magnitude
         
@@ -432,6 +2910,44 @@ class MyDAQ():
         else:
             return mean_magnitude, std_magnitude, mean_phase, std_phase
     
+    @staticmethod
+    def decay_function(time, amplitude: float, tau: float, offset: float):
+        """An exponential decay, amplitude * exp(-time / tau) + offset."""
+        return amplitude * np.exp(-time / tau) + offset
+    
+    @staticmethod
+    def fit_decay(times, amplitudes, p0=None):
+        """Fit decay_function to the peaks of a decaying oscillation.
+        
+        parameters
+        ----------
+        times : np.ndarray
+            The times of the peaks, like provided by measure_decay or a
+            PeakDetector
+        amplitudes : np.ndarray
+            The values of the signal at the peaks
+        p0 : list[float]
+            The initial amplitude, tau and offset. If None, estimated from
+            the first and last peak.
+        
+        returns
+        -------
+        np.ndarray
+            The fitted amplitude, tau and offset
+        np.ndarray
+            The standard errors of the fitted parameters
+        """
+        times = np.asarray(times)
+        amplitudes = np.asarray(amplitudes)
+        
+        if p0 is None:
+            p0 = [amplitudes[0] - amplitudes[-1],
+                  (times[-1] - times[0]) / 3,
+                  amplitudes[-1]]
+        
+        popt, pcov = curve_fit(MyDAQ.decay_function, times, amplitudes, p0=p0)
+        return popt, np.sqrt(np.diag(pcov))
+    
     @staticmethod
     def make_bode_plot(**kwargs):
         """Create a bodeplot figure.
@@ -562,6 +3078,78 @@ class MyDAQ():
         ax.scatter(phase, magnitude, color=color, **kwargs)
         ax.set_title('Polar plot of transfer function')
     
+    @staticmethod
+    def to_volts(raw, coefficients) -> np.ndarray:
+        """Convert raw ADC codes of one channel to volts.
+        
+        parameters
+        ----------
+        raw : np.ndarray
+            The raw codes
+        coefficients : np.ndarray
+            The scaling polynomial of the channel, in order of increasing
+            power, like in raw_scaling
+        
+        returns
+        -------
+        np.ndarray
+            The voltages
+        """
+        return np.polynomial.polynomial.polyval(np.asarray(raw, dtype=float),
+                                                coefficients)
+
+    @staticmethod
+    def save_raw(path: str, data: ScaledArray) -> None:
+        """Save raw data, with its scaling in path with suffix _scaling."""
+        np.save(path, data.raw)
+        np.save(path.replace('.npy', '_scaling.npy'), data.coefficients)
+
+    @staticmethod
+    def load_raw(path: str, mmap_mode='r') -> ScaledArray:
+        """Load raw data saved with save_raw, memory mapped by default.
+        
+        returns
+        -------
+        ScaledArray
+            The raw data, converted to volts when it is indexed
+        """
+        return ScaledArray(np.load(path, mmap_mode=mmap_mode),
+                           np.load(path.replace('.npy', '_scaling.npy')))
+
+    @staticmethod
+    def find_alignment_offset(reference, signal) -> int:
+        """Find the offset in samples of signal with respect to reference.
+        
+        The offset is the lag of the maximum of the cross-correlation, a
+        positive offset means signal lags behind reference. For periodic
+        waveforms the offset is only unique within one period.
+        
+        parameters
+        ----------
+        reference : np.ndarray
+            The written data
+        signal : np.ndarray
+            The read data
+        
+        returns
+        -------
+        int
+            The offset in samples
+        """
+        reference = np.asarray(reference, dtype=float)
+        signal = np.asarray(signal, dtype=float)
+        length = len(reference) + len(signal)
+        
+        correlation = np.fft.irfft(np.fft.rfft(signal, length)
+                                   * np.conj(np.fft.rfft(reference, length)),
+                                   length)
+        lag = int(np.argmax(correlation))
+        
+        # Lags past the end wrap around to negative offsets
+        if lag >= len(signal):
+            lag -= length
+        return lag
+
     @staticmethod
     def find_nearest_idx(a, value):
         return (np.abs(a - value)).argmin()
@@ -575,6 +3163,7 @@ class MyDAQ():
         phase: float = 0,
         duration: float = 1,
         phaseInDegrees: bool = True,
+        coherent: bool = False,
     ) -> np.ndarray:
         """
         Geneate a waveform from the 4 basic wave parameters
@@ -597,6 +3186,10 @@ class MyDAQ():
             Duration of the waveform in seconds. The default is 1.
         phaseInDegrees: bool, optional
             Whether phase is given in degrees. The default is True.
+        coherent: bool, optional
+            Whether to move the frequency to the nearest frequency with a
+            whole number of periods in the waveform, see snap_frequencies.
+            The default is False.
 
         Returns
         -------
@@ -604,9 +3197,15 @@ class MyDAQ():
             ndarray containing the discrete times at which the waveform is evaluated.
         wave : ndarray
             ndarray of the evaluated waveform.
+        frequency : float
+            Only if coherent is True. The snapped frequency of the waveform,
+            to analyse at.
 
         """
         timeArray = MyDAQ.getTimeArray(duration, samplerate)
+        if coherent:
+            frequency = MyDAQ.snap_frequencies(frequency, samplerate,
+                                               len(timeArray))
         if phaseInDegrees:
             phase = np.deg2rad(phase)
 
@@ -615,8 +3214,95 @@ class MyDAQ():
 
         wave = function(timeArray, amplitude, frequency, phase)
 
+        if coherent:
+            return timeArray, wave, frequency
         return timeArray, wave
 
+    @staticmethod
+    def generateMultisine(
+        samplerate: int,
+        frequencies,
+        amplitude: float = 1,
+        duration: float = 1,
+    ):
+        """
+        Generate a periodic multisine with Schroeder phases.
+
+        Every frequency is moved to the nearest multiple of 1/duration, so
+        each tone fits a whole number of periods in the waveform and lands
+        exactly on one FFT bin. The Schroeder phases keep the crest factor
+        low, so every tone gets as much amplitude as possible.
+
+        Parameters
+        ----------
+        samplerate: int
+            Samplerate with which to sample waveform.
+        frequencies : np.ndarray
+            Frequencies of the tones.
+        amplitude : int or float, optional
+            Peak amplitude of the waveform in volts. The default is 1.
+        duration : int or float, optional
+            Duration of the waveform in seconds. The default is 1.
+
+        Returns
+        -------
+        timeArray : ndarray
+            ndarray containing the discrete times at which the waveform is evaluated.
+        wave : ndarray
+            ndarray of the evaluated waveform.
+        bins : ndarray
+            The rfft bin of every tone, the frequency of tone k is
+            bins[k] * samplerate / len(wave).
+
+        """
+        timeArray = MyDAQ.getTimeArray(duration, samplerate)
+        samples = len(timeArray)
+        
+        bins = np.round(np.asarray(frequencies) * samples
+                        / samplerate).astype(int)
+        if len(np.unique(bins)) != len(bins):
+            raise ValueError("Frequencies should be at least 1/duration apart.")
+        if np.any(bins < 1) or np.any(bins >= samples / 2):
+            raise ValueError("Frequencies should be between 1/duration and "
+                             "half the samplerate.")
+        
+        k = np.arange(1, len(bins) + 1)
+        phases = -np.pi * k * (k - 1) / len(bins)
+        
+        wave = np.zeros(samples)
+        for tone, phase in zip(bins, phases):
+            wave += np.sin(2 * np.pi * tone * timeArray * samplerate / samples
+                           + phase)
+        wave *= amplitude / np.max(np.abs(wave))
+        
+        return timeArray, wave, bins
+
+    @staticmethod
+    def snap_frequencies(frequencies, samplerate: int, samples: int):
+        """Move frequencies to the nearest whole number of periods.
+        
+        A sine with a whole number of periods in the record falls exactly on
+        one FFT bin, so its bin holds all of its power without leakage and
+        no integration_range is needed. At least one period is kept.
+        
+        parameters
+        ----------
+        frequencies : float | np.ndarray
+            The requested frequencies
+        samplerate : int
+            The samplerate of the record
+        samples : int
+            The number of samples in the record
+        
+        returns
+        -------
+        float | np.ndarray
+            The snapped frequencies, multiples of samplerate / samples
+        """
+        periods = np.maximum(np.round(np.asarray(frequencies) * samples
+                                      / samplerate), 1)
+        return periods * samplerate / samples
+
     @staticmethod
     def findFunction(function: str):
         """Find a function to generate simple continuous waveforms.